@@ -2,14 +2,34 @@
 '''nclint: A simple script which checks NetCDF files for problems
 
 Outputs the name of any file that fails any check.
+
+Can also be imported, to check files from Python with `lint`.
 '''
 
+import os
 import sys
+import csv
+import json
+import math
+import time
+import array
+import heapq
+import types
+import struct
+import pickle
+import hashlib
+import tempfile
+import weakref
+import threading
+import collections
 import argparse
+import fnmatch
+import itertools
+import contextlib
 
-import numpy
-
-import nchelpers
+# The scientific stack (numpy, netCDF4 and nchelpers) is slow to import, so
+# it is imported only by the functions that need it. Listing checks, and
+# running checks that only read classic format headers, never import it.
 
 check_list = []
 def is_a_check(fun):
@@ -17,7 +37,675 @@ def is_a_check(fun):
     return fun
 
 
+# Checks (and extracts, see `lint_file`) that need nothing but a file's
+# header (dimensions, variables and attributes), so can be run on a classic
+# format file without opening it with the netCDF library
+header_check_list = []
+def only_reads_header(fun):
+    header_check_list.append(fun.__name__)
+    return fun
+
+
+# Checks that read variable data, not just metadata
+data_check_list = []
+def reads_data(fun):
+    data_check_list.append(fun.__name__)
+    return fun
+
+
+# Data checks that read variable data only through the ReadPlanner and need
+# nothing from the netCDF library, so can be run on a classic format file
+# mapped into memory (see HeaderVariable.mapped)
+mapped_check_list = []
+def can_read_mapped(fun):
+    mapped_check_list.append(fun.__name__)
+    return fun
+
+
+# Checks across all the files checked (see MetadataIndex), rather than of one
+# file at a time
+aggregate_check_list = []
+def checks_across_files(fun):
+    aggregate_check_list.append(fun.__name__)
+    return fun
+
+
+# Functions returning the (variable name, bounds) blocks of data that a data
+# check will read from a file, indexed by check name (see ReadPlanner). Checks
+# given the same function (e.g. because they read through a memo) share its reads.
+read_plans = {}
+def plans_reads(planner):
+    def decorator(fun):
+        read_plans[fun.__name__] = planner
+        return fun
+    return decorator
+
+
+# Maximum number of array elements that a data check reads at once
+tile_elements = 2 ** 20
+
+# Maximum number of bytes that a check scanning whole variables (e.g.
+# masked_layers) reads at once (--block-size)
+block_bytes = 2 ** 26
+
+# The I/O budget per file (--io-budget), in bytes or seconds of variable
+# data read, under which data checks read a random sample of their blocks
+# (see `sampled_tiles`); None for no budget
+io_budget_bytes = None
+io_budget_seconds = None
+
+# The seed from which the samples are drawn
+sample_seed = 0
+
+# Module settings that worker processes must share with the main process
+settings_names = ('tile_elements', 'block_bytes', 'io_budget_bytes', 'io_budget_seconds',
+                  'sample_seed')
+
+def settings():
+    '''Returns the current module settings, as a dict'''
+    return {name: globals()[name] for name in settings_names}
+
+
+def configure(**settings):
+    '''Changes module settings, e.g. configure(block_bytes=2 ** 30)'''
+    for name in settings:
+        if name not in settings_names:
+            raise ValueError("Unknown setting '{}'".format(name))
+    globals().update(settings)
+
+
+def parse_size(text):
+    '''Parses a size in bytes, such as 65536, 64k, 512M or 2G'''
+    text = text.strip()
+    multiplier = 1
+    if text and text[-1].upper() in 'KMGT':
+        multiplier = 2 ** (10 * ('KMGT'.index(text[-1].upper()) + 1))
+        text = text[:-1]
+    size = int(float(text) * multiplier)
+    if size <= 0:
+        raise ValueError('Size must be positive')
+    return size
+
+
+def parse_budget(text):
+    '''Parses an I/O budget, in bytes (see `parse_size`) or, with an `s`
+    suffix, in seconds, such as 512M or 2.5s, into (bytes, seconds), one
+    of which is None'''
+    text = text.strip()
+    if text[-1:].lower() == 's':
+        seconds = float(text[:-1])
+        if seconds <= 0:
+            raise ValueError('Budget must be positive')
+        return None, seconds
+    return parse_size(text), None
+
+
+def _product(values):
+    result = 1
+    for value in values:
+        result *= value
+    return result
+
+
+def tile_shape(var_, shape, max_elements=None):
+    '''Returns the shape of the tiles in which to read a block of `shape` from
+    the trailing dimensions of variable `var_`.
+
+    Tiles are whole multiples of the variable's chunks where possible, are
+    grown innermost dimension first, and contain at most `max_elements`
+    (default `tile_elements`) values, so reading tile by tile never holds
+    more than that in memory, however large the block.
+    '''
+    if max_elements is None:
+        max_elements = tile_elements
+    try:
+        chunks = var_.chunking()
+    except Exception:
+        chunks = None
+    if isinstance(chunks, (list, tuple)):
+        chunks = [max(1, min(chunk, size)) for chunk, size in zip(chunks[-len(shape):], shape)]
+    else:
+        # Contiguous (or classic format) storage: read along rows
+        chunks = [1] * len(shape)
+    tile = list(chunks)
+    # Split chunks that are too big to read in one go, outermost dimension first
+    for dim in range(len(tile)):
+        if _product(tile) <= max_elements:
+            break
+        tile[dim] = max(1, max_elements // (_product(tile) // tile[dim]))
+    # Grow tiles by whole chunks, innermost dimension first
+    for dim in reversed(range(len(tile))):
+        limit = max_elements // (_product(tile) // tile[dim])
+        grown = min(shape[dim], (limit // chunks[dim]) * chunks[dim])
+        tile[dim] = max(tile[dim], grown)
+    return tuple(tile)
+
+
+def iter_tiles(shape, tile):
+    '''Yields the bounds of the tiles of shape `tile` that cover an array of
+    `shape`, as tuples of (start, stop) pairs'''
+    origins = [range(0, size, step) for size, step in zip(shape, tile)]
+    for origin in itertools.product(*origins):
+        yield tuple((start, min(start + step, size))
+                    for start, step, size in zip(origin, tile, shape))
+
+
+def layer_tiles(var_, index):
+    '''Returns the bounds of the tiles in which to read layer `index` (along the
+    first, time, dimension) of variable `var_`'''
+    if len(var_.shape) < 1 or var_.shape[0] <= index:
+        return []
+    shape = var_.shape[1:]
+    return [((index, index + 1),) + tile for tile in iter_tiles(shape, tile_shape(var_, shape))]
+
+
+def variable_tiles(var_):
+    '''Returns the bounds of the tiles in which to read all of variable `var_`'''
+    return list(iter_tiles(var_.shape, tile_shape(var_, var_.shape)))
+
+
+# The netCDF library's default fill values, by numpy type string
+default_fill_values = {
+    'i1': -127, 'u1': 255, 'i2': -32767, 'u2': 65535, 'i4': -2147483647, 'u4': 4294967295,
+    'i8': -9223372036854775806, 'u8': 18446744073709551614,
+    'f4': 9.969209968386869e+36, 'f8': 9.969209968386869e+36,
+}
+
+
+def _cast_attr(var_, attrs, name, dtype):
+    '''Returns attribute `name` of variable `var_` as a 1-D array of `dtype`,
+    or None if it is missing or doesn't survive the cast unchanged (which
+    netCDF4 takes to mean it isn't to be used, see its _check_safecast)'''
+    import numpy
+
+    if name not in attrs:
+        return None
+    value = numpy.atleast_1d(numpy.array(var_.getncattr(name)))
+    try:
+        with numpy.errstate(all='ignore'):
+            cast = value.astype(dtype)
+            same = (cast == value) | (numpy.isnan(cast) & numpy.isnan(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return cast if numpy.all(same) else None
+
+
+def masking_rules(var_):
+    '''Returns the rules by which netCDF4 masks the raw values of variable
+    `var_`, as a (mask_values, valid_min, valid_max) tuple, or None if no
+    value of `var_` can be masked.
+
+    `mask_values` is an array of the _FillValue (or, if there is none, the
+    default fill value for the type) and any missing_value(s). `valid_min`
+    and `valid_max` come from valid_range or, failing that, valid_min and
+    valid_max, and may be None. As in netCDF4, attributes that can't be
+    cast to the variable's type unchanged are ignored. This needs only the
+    variable's metadata.
+    '''
+    import numpy
+
+    try:
+        dtype = numpy.dtype(var_.dtype)
+    except TypeError:
+        return None
+    if dtype.kind not in 'iuf':
+        return None
+    attrs = set(var_.ncattrs())
+    fill_value = _cast_attr(var_, attrs, '_FillValue', dtype)
+    if fill_value is None:
+        fill_value = numpy.array([default_fill_values[dtype.str[1:]]], dtype=dtype)
+    mask_values = [fill_value[:1]]
+    missing_value = _cast_attr(var_, attrs, 'missing_value', dtype)
+    if missing_value is not None:
+        mask_values.append(missing_value)
+    valid_min = valid_max = None
+    valid_range = _cast_attr(var_, attrs, 'valid_range', dtype)
+    if valid_range is not None and len(valid_range) >= 2:
+        valid_min, valid_max = valid_range[:2]
+    else:
+        valid_min, valid_max = [
+            None if value is None else value[0]
+            for value in (_cast_attr(var_, attrs, name, dtype) for name in ('valid_min', 'valid_max'))
+        ]
+    return numpy.concatenate(mask_values), valid_min, valid_max
+
+
+def masked_values(values, rules):
+    '''Returns a boolean array marking which of the raw `values` are masked
+    under `rules` (as returned by `masking_rules`)'''
+    import numpy
+
+    mask_values, valid_min, valid_max = rules
+    mask = numpy.isin(values, mask_values)
+    if mask_values.dtype.kind == 'f' and numpy.isnan(mask_values).any():
+        mask |= numpy.isnan(values)
+    if valid_min is not None:
+        mask |= values < valid_min
+    if valid_max is not None:
+        mask |= values > valid_max
+    return mask
+
+
+@contextlib.contextmanager
+def raw_values(var_):
+    '''Temporarily turns off netCDF4's automatic masking and scaling of
+    variable `var_`, so that indexing it returns plain arrays of raw values'''
+    mask, scale = var_.mask, var_.scale
+    var_.set_auto_maskandscale(False)
+    try:
+        yield var_
+    finally:
+        var_.set_auto_mask(mask)
+        var_.set_auto_scale(scale)
+
+
+def _overlaps(a, b):
+    '''Returns True if blocks (bounds) `a` and `b` have any element in common'''
+    return all(a_start < b_stop and b_start < a_stop
+               for (a_start, a_stop), (b_start, b_stop) in zip(a, b))
+
+
+def _bounding(a, b):
+    '''Returns the smallest block (bounds) holding both blocks `a` and `b`'''
+    return tuple((min(a_start, b_start), max(a_stop, b_stop))
+                 for (a_start, a_stop), (b_start, b_stop) in zip(a, b))
+
+
+class ReadPlanner(object):
+    '''Coordinates the variable data read by the checks run on one file.
+
+    Data checks declare (with `plans_reads`) the blocks of variable data
+    they will read, each as a (variable name, bounds) pair; checks sharing
+    a plan (e.g. through a memo, as the time axis checks do) read it once.
+    Overlapping blocks of a variable, even if planned on different tilings
+    (e.g. layer_one_missing's tiles of a layer and masked_layers' blocks
+    of layers), are merged into their union, where that reads no more than
+    the blocks would separately and holds no more than `block_bytes` (or
+    the largest of them). Unions that more than one read will be served
+    from are fetched once, by the first of those reads, and each read gets
+    its block sliced out of them; each union is dropped as soon as its
+    last read is done. Other blocks are fetched when read, so checks can
+    still stop early. All reads return raw values (see `raw_values`). The
+    number of bytes fetched from the file is kept in `bytes_read`, and the
+    number returned to the checks (fetched or shared) in `bytes_served`.
+    '''
+
+    def __init__(self, nc):
+        # The planner is kept in the file's state, so must not keep it open
+        self.nc = weakref.proxy(nc)
+        self.demand = collections.Counter()
+        # (varname, bounds) of each shared planned block -> its union's, and
+        # the reads still to be served from each union
+        self.unions = {}
+        self.union_demand = collections.Counter()
+        self.buffers = {}
+        self.bytes_read = self.bytes_served = 0
+        self.planned = False
+        # The fraction of their blocks that data checks read (see
+        # `sampled_tiles`), and the bytes of blocks that the check being run
+        # wanted and kept
+        self.fraction = 1.0
+        self.wanted_bytes = self.kept_bytes = 0
+
+    def plan(self, check_names):
+        '''Plans the reads of the named checks'''
+        self.planned = True
+        plans = []
+        for check_name in check_names:
+            if check_name in read_plans and read_plans[check_name] not in plans:
+                plans.append(read_plans[check_name])
+        for plan in plans:
+            self.demand.update(set(plan(self.nc)))
+        unions = self.merge()
+        self.fraction = sample_fraction(self.nc, unions, self.bytes_read)
+        for key, members in unions.items():
+            demand = sum(self.demand[member] for member in members)
+            # Sampled reads don't match the planned blocks, so under an I/O
+            # budget only the blocks that are read whole are shared
+            varname, bounds = key
+            if demand > 1 and (self.fraction >= 1 or
+                               _tile_bytes(self.nc.variables[varname], bounds) <= sample_min_bytes):
+                self.union_demand[key] = demand
+                for member in members:
+                    self.unions[member] = key
+
+    def merge(self):
+        '''Returns the unions of the planned blocks, as a dict of (variable
+        name, bounds) of each union to the (variable name, bounds) of the
+        blocks merged into it'''
+        by_variable = collections.defaultdict(list)
+        for varname, bounds in self.demand:
+            by_variable[varname].append(bounds)
+        unions = {}
+        for varname, blocks in by_variable.items():
+            var_ = self.nc.variables[varname]
+            # Each union is [bounds, members, bytes of members, bytes of the
+            # largest member]. Blocks are taken in order of their start along
+            # the first dimension, so unions ending before a block starts are
+            # done with.
+            active, done = [], []
+            for bounds in sorted(blocks):
+                size = _tile_bytes(var_, bounds)
+                union = [bounds, [bounds], size, size]
+                if bounds:
+                    done.extend(other for other in active if other[0][0][1] <= bounds[0][0])
+                    active = [other for other in active if other[0][0][1] > bounds[0][0]]
+                merged = True
+                while merged:
+                    merged = False
+                    for other in active:
+                        if not _overlaps(other[0], union[0]):
+                            continue
+                        box = _bounding(other[0], union[0])
+                        box_size = _tile_bytes(var_, box)
+                        largest = max(other[3], union[3])
+                        if box_size <= other[2] + union[2] and box_size <= max(block_bytes, largest):
+                            active.remove(other)
+                            union = [box, other[1] + union[1], other[2] + union[2], largest]
+                            merged = True
+                            break
+                active.append(union)
+            for union in done + active:
+                unions[(varname, union[0])] = [(varname, member) for member in union[1]]
+        return unions
+
+    def fetch(self, varname, bounds):
+        '''Reads block `bounds` of variable `varname` from the file'''
+        import numpy
+
+        var_ = self.nc.variables[varname]
+        index = tuple(slice(start, stop) for start, stop in bounds)
+        if isinstance(var_, HeaderVariable):
+            # A view of the file mapped into memory; nothing is copied
+            values = var_.mapped()[index]
+        else:
+            with raw_values(var_):
+                values = numpy.asarray(var_[index])
+        self.bytes_read += values.nbytes
+        return values
+
+    def read(self, varname, bounds):
+        '''Returns block `bounds` of variable `varname`, sliced out of its
+        shared union if it has one'''
+        union = self.unions.get((varname, bounds))
+        if union is None:
+            values = self.fetch(varname, bounds)
+        else:
+            values = self.buffers.get(union)
+            if values is None:
+                values = self.buffers[union] = self.fetch(*union)
+            self.union_demand[union] -= 1
+            if self.union_demand[union] <= 0:
+                self.buffers.pop(union, None)
+            values = values[tuple(slice(start - origin, stop - origin)
+                                  for (start, stop), (origin, _) in zip(bounds, union[1]))]
+        self.bytes_served += values.nbytes
+        return values
+
+
+def read_planner(nc):
+    '''Returns the ReadPlanner for open NetCDF file `nc`'''
+    state = file_state(nc)
+    if 'read_planner' not in state:
+        state['read_planner'] = ReadPlanner(nc)
+    return state['read_planner']
+
+
+# Read rate, in bytes per second, at which a budget in seconds is turned
+# into bytes until reads have been timed
+assumed_read_rate = 2 ** 27
+_read_rate = [None]
+
+def observe_read_rate(bytes_read, seconds):
+    '''Learns the rate at which this process reads variable data from a
+    data check that read `bytes_read` in `seconds`'''
+    if bytes_read and seconds > 0:
+        rate = bytes_read / seconds
+        _read_rate[0] = rate if _read_rate[0] is None else 0.8 * _read_rate[0] + 0.2 * rate
+
+
+def io_budget():
+    '''Returns the per-file I/O budget in bytes, or None if there is none'''
+    if io_budget_bytes is not None:
+        return io_budget_bytes
+    if io_budget_seconds is not None:
+        return int(io_budget_seconds * (_read_rate[0] or assumed_read_rate))
+    return None
+
+
+# Sampled tiles are split so that at least this many are read (see `sample_tiles`)
+min_sample_tiles = 16
+
+# Blocks of at most this many bytes are read whole, even under an I/O budget:
+# sampling them would save next to nothing
+sample_min_bytes = 2 ** 16
+
+
+def _tile_bytes(var_, bounds):
+    return _product(stop - start for start, stop in bounds) * (_itemsize(var_) or 1)
+
+
+def _overlap_bytes(var_, a, b):
+    return _product(max(0, min(a_stop, b_stop) - max(a_start, b_start))
+                    for (a_start, a_stop), (b_start, b_stop) in zip(a, b)) * (_itemsize(var_) or 1)
+
+
+def sample_fraction(nc, blocks, bytes_read=0):
+    '''Returns the fraction of their blocks larger than `sample_min_bytes`
+    that data checks may read from `nc` if they are to read (variable name,
+    bounds) `blocks` (those planned), having already read `bytes_read`,
+    within the I/O budget. Smaller blocks are read whole, and what is left
+    of the budget is spread over the larger ones.'''
+    budget = io_budget()
+    if budget is None:
+        return 1.0
+    sizes = [_tile_bytes(nc.variables[varname], bounds) for varname, bounds in blocks]
+    small = sum(size for size in sizes if size <= sample_min_bytes)
+    large = sum(sizes) - small
+    available = budget - bytes_read - small
+    if large <= available:
+        return 1.0
+    return max(0.0, available) / large
+
+
+def sample_tiles(var_, path, varname, tiles, fraction):
+    '''Returns a random `fraction` of `tiles` of variable `var_` (named
+    `varname`) in file `path`, in order, along with all of those of at most
+    `sample_min_bytes`. The sample depends only on these and `sample_seed`,
+    so is the same every time.
+
+    Tiles too big for a sample of at least `min_sample_tiles` of them are
+    first split into smaller chunk-aligned pieces, so that a budget much
+    smaller than one planned block is still kept to (within a chunk).
+    '''
+    if fraction >= 1 or not tiles:
+        return tiles
+    import random
+
+    small = [_tile_bytes(var_, bounds) <= sample_min_bytes for bounds in tiles]
+    wanted = sum(_tile_bytes(var_, bounds) for bounds, is_small in zip(tiles, small) if not is_small)
+    piece_elements = max(1, int(fraction * wanted / min_sample_tiles) // (_itemsize(var_) or 1))
+    pieces, whole = [], []
+    for bounds, is_small in zip(tiles, small):
+        extent = tuple(stop - start for start, stop in bounds)
+        if is_small or _product(extent) <= piece_elements:
+            if is_small:
+                whole.append(len(pieces))
+            pieces.append(bounds)
+            continue
+        for piece in iter_tiles(extent, tile_shape(var_, extent, piece_elements)):
+            pieces.append(tuple((start + low, start + high)
+                                for (start, _), (low, high) in zip(bounds, piece)))
+    large = [i for i in range(len(pieces)) if i not in set(whole)]
+    key = '{}:{}:{}'.format(sample_seed, path, varname).encode('utf-8', 'surrogateescape')
+    rng = random.Random(int.from_bytes(hashlib.sha1(key).digest()[:8], 'big'))
+    count = max(1, int(round(fraction * len(large)))) if large else 0
+    return [pieces[i] for i in sorted(whole + rng.sample(large, count))]
+
+
+def sampled_tiles(nc, varname, tiles):
+    '''Returns the tiles (chunk-aligned blocks, as planned) of variable
+    `varname` that a data check should read, out of `tiles`.
+
+    These are all of them unless the I/O budget (--io-budget) is too
+    small for all the blocks planned for the file, when a reproducible
+    random sample of them (see `sample_tiles`) is returned instead, at
+    the fraction that fits. Either way the bytes wanted and kept are
+    counted towards the check's coverage (see CheckResult).
+    '''
+    planner = read_planner(nc)
+    var_ = nc.variables[varname]
+    wanted = sum(_tile_bytes(var_, bounds) for bounds in tiles)
+    planner.wanted_bytes += wanted
+    if planner.fraction >= 1:
+        planner.kept_bytes += wanted
+        return tiles
+    kept = sample_tiles(var_, nc.filepath(), varname, tiles, planner.fraction)
+    planner.kept_bytes += sum(_tile_bytes(var_, bounds) for bounds in kept)
+    return kept
+
+
+def confirming_tiles(nc, varname, tiles, sample):
+    '''Returns the tiles of variable `varname` to read to confirm that all of
+    `tiles` is masked, given that all of `sample` (see `sampled_tiles`) is.
+
+    A sample can only show that data holds a value, never that it doesn't,
+    so a budget must not turn a pass into a failure: unless `sample` was
+    all of the data, all of `tiles` is read, and the bytes not already in
+    `sample` are counted as kept.
+    '''
+    planner = read_planner(nc)
+    if planner.fraction >= 1:
+        return []
+    var_ = nc.variables[varname]
+    unsampled = sum(_tile_bytes(var_, bounds) for bounds in tiles) - sum(
+        _overlap_bytes(var_, bounds, piece) for bounds in tiles for piece in sample)
+    planner.kept_bytes += unsampled
+    return tiles
+
+
+def _all_masked(nc, varname, tiles, rules):
+    planner = read_planner(nc)
+    for bounds in tiles:
+        if not masked_values(planner.read(varname, bounds), rules).all():
+            return False
+    return True
+
+
+def layer_is_missing(nc, varname, index):
+    '''Returns True if every value of layer `index` (along the first, time,
+    dimension) of variable `varname` is masked.
+
+    For a 3-D variable a layer is a single grid; for 4-D and higher
+    variables it is the whole block at that time (e.g. every level), which
+    is only missing if all of it is. A variable with no layer `index`, or
+    with an empty layer, has no missing layer.
+
+    The layer is read in chunk-aligned tiles, stopping at the first tile
+    holding an unmasked value, so memory use is bounded by the tile size.
+    Under an I/O budget a layer whose sampled tiles are all masked is read
+    whole to confirm it is missing (see `confirming_tiles`).
+    '''
+    var_ = nc.variables[varname]
+    rules = masking_rules(var_)
+    tiles = layer_tiles(var_, index)
+    if rules is None or not tiles:
+        return False
+    sample = sampled_tiles(nc, varname, tiles)
+    if not _all_masked(nc, varname, sample, rules):
+        return False
+    return _all_masked(nc, varname, confirming_tiles(nc, varname, tiles, sample), rules)
+
+
+def has_masked_values(nc, varname):
+    '''Returns True if any value of variable `varname` would be masked.
+
+    The variable's metadata is consulted first to see whether any value
+    can be masked at all, and if so which raw values would be. The raw
+    values are then scanned in bounded, chunk-aligned tiles, stopping at
+    the first masked value, without building masked arrays.
+    '''
+    var_ = nc.variables[varname]
+    rules = masking_rules(var_)
+    if rules is None:
+        return False
+    planner = read_planner(nc)
+    for bounds in sampled_tiles(nc, varname, variable_tiles(var_)):
+        if masked_values(planner.read(varname, bounds), rules).any():
+            return True
+    return False
+
+
+def grid_variables(nc):
+    '''Returns the names of the grid (3 or more dimensional) variables in `nc`'''
+    return [varname for varname, var_ in nc.variables.items() if len(var_.dimensions) >= 3]
+
+
+def coordinate_variables(nc):
+    '''Returns the names of the dimension (coordinate) variables in `nc`'''
+    return [dim for dim in nc.dimensions if dim in nc.variables]
+
+
+def block_tiles(var_):
+    '''Returns the bounds of the tiles in which to read all of variable `var_`,
+    each holding at most `block_bytes`. Tiles are chunk-aligned and span
+    as many whole layers (along the first, time, dimension) as fit.'''
+    import numpy
+
+    max_elements = max(1, block_bytes // numpy.dtype(var_.dtype).itemsize)
+    return list(iter_tiles(var_.shape, tile_shape(var_, var_.shape, max_elements)))
+
+
+def masked_layer_indices(nc, varname):
+    '''Returns the indices of the layers (along the first, time, dimension)
+    of variable `varname` in which every value is masked.
+
+    As in `layer_is_missing`, a layer of a 4-D or higher variable is the
+    whole block at that time. The variable is read in tiles of at most
+    `block_bytes` (see `block_tiles`); each tile's mask is reduced to
+    one flag per layer, so the work is vectorized across layers. Tiles
+    covering only layers already known to hold a value are skipped. Under
+    an I/O budget, layers whose sampled tiles are all masked are read
+    whole to confirm they are missing (see `confirming_tiles`).
+    '''
+    import numpy
+
+    var_ = nc.variables[varname]
+    rules = masking_rules(var_)
+    if rules is None or not var_.shape or not var_.shape[0]:
+        return []
+    planner = read_planner(nc)
+    missing = numpy.ones(var_.shape[0], dtype=bool)
+    # With a sample of the tiles read, only layers of which some part was
+    # read can be suspected to be missing
+    seen = numpy.zeros(var_.shape[0], dtype=bool)
+    sample = sampled_tiles(nc, varname, block_tiles(var_))
+    for bounds in sample:
+        start, stop = bounds[0]
+        if not missing[start:stop].any():
+            continue
+        mask = masked_values(planner.read(varname, bounds), rules)
+        missing[start:stop] &= mask.all(axis=tuple(range(1, mask.ndim)))
+        seen[start:stop] = True
+    return [int(index) for index in numpy.flatnonzero(missing & seen)
+            if _all_masked(nc, varname,
+                           confirming_tiles(nc, varname, layer_tiles(var_, index), sample), rules)]
+
+
+def _layer_one_missing_reads(nc):
+    return [(varname, bounds) for varname in grid_variables(nc)
+            for bounds in layer_tiles(nc.variables[varname], 1)]
+
+
+def _masked_layers_reads(nc):
+    return [(varname, bounds) for varname in grid_variables(nc)
+            for bounds in block_tiles(nc.variables[varname])]
+
+
 @is_a_check
+@reads_data
+@can_read_mapped
+@plans_reads(_layer_one_missing_reads)
 def layer_one_missing(nc):
     '''Checks an open NetCDF file for a missing layer at t=1
 
@@ -34,17 +722,34 @@ def layer_one_missing(nc):
     file and testing whether the layer at t=1 is all NA/missing.
     '''
 
-    for varname, var_ in nc.variables.items():
-        # Only check grid variables
-        if len(var_.dimensions) < 3:
-            continue
-        one_layer = var_[1,:,:]
-        if isinstance(one_layer, numpy.ma.MaskedArray) and one_layer.mask.all():
+    for varname in grid_variables(nc):
+        if layer_is_missing(nc, varname, 1):
             return True
     return False
 
 
 @is_a_check
+@reads_data
+@can_read_mapped
+@plans_reads(_masked_layers_reads)
+def masked_layers(nc):
+    '''Checks an open NetCDF file for missing layers at any time step
+
+    Like layer_one_missing, but looks at every time step of every grid
+    variable. Returns the indices of the missing layers of each variable
+    that has any. Variables are read a block of time steps at a time, in
+    blocks of at most --block-size bytes.
+    '''
+    missing = {}
+    for varname in grid_variables(nc):
+        indices = masked_layer_indices(nc, varname)
+        if indices:
+            missing[varname] = indices
+    return missing
+
+
+@is_a_check
+@only_reads_header
 def vars_missing_units(nc):
     '''Returns True if any variable is not attributed with units'''
     for var_ in nc.variables.values():
@@ -54,6 +759,7 @@ def vars_missing_units(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_time_units(nc):
     '''Returns True if the time variable is missing units attribute'''
     if 'time' in nc.variables:
@@ -62,55 +768,100 @@ def missing_time_units(nc):
         return True
 
 
+_file_state = weakref.WeakKeyDictionary()
+
+def file_state(nc):
+    '''Returns a dict in which values derived from open NetCDF file `nc` can be
+    memoized, so that they are computed at most once per file'''
+    state = _file_state.get(nc)
+    if state is None:
+        state = _file_state[nc] = {}
+    return state
+
+
+def global_attr_names(nc):
+    '''Returns the (interned) names of all global attributes of NetCDF file `nc`
+    as a frozenset. The attribute names are read from the file only once.'''
+    state = file_state(nc)
+    if 'global_attr_names' not in state:
+        state['global_attr_names'] = frozenset(sys.intern(str(attr)) for attr in nc.ncattrs())
+    return state['global_attr_names']
+
+
+_attr_profiles = {}
+
+def attr_profile(attrs):
+    '''Compiles array `attrs` of attribute names into a profile: a tuple of the
+    interned names in their original order, and a frozenset of them'''
+    key = tuple(attrs)
+    profile = _attr_profiles.get(key)
+    if profile is None:
+        names = tuple(sys.intern(attr) for attr in attrs)
+        profile = _attr_profiles[key] = (names, frozenset(names))
+    return profile
+
+
 def missing_global_attrs(nc, attrs):
     '''Returns a list of all global attributes in array `attrs` that are missing from NetCDF file `nc`'''
-    return [attr for attr in attrs if not hasattr(nc, attr)]
+    names, name_set = attr_profile(attrs)
+    present = global_attr_names(nc)
+    if name_set <= present:
+        return []
+    return [attr for attr in names if attr not in present]
+
+
+cmip5_global_attrs = '''
+    branch_time
+    contact
+    Conventions
+    creation_date
+    experiment
+    experiment_id
+    forcing
+    frequency
+    initialization_method
+    institute_id
+    institution
+    model_id
+    modeling_realm
+    parent_experiment_id
+    parent_experiment_rip
+    physics_version
+    product
+    project_id
+    realization
+    source
+    table_id
+    tracking_id
+'''.split()
 
 
 @is_a_check
+@only_reads_header
 def missing_cmip5_global_attrs(nc):
     """Checks if any required CMIP5 output global attribute is missing.
     Reference: http://cmip-pcmdi.llnl.gov/cmip5/docs/CMIP5_output_metadata_requirements_22May14.pdf
     """
-    return missing_global_attrs(nc, '''
-        branch_time
-        contact
-        Conventions
-        creation_date
-        experiment
-        experiment_id
-        forcing
-        frequency
-        initialization_method
-        institute_id
-        institution
-        model_id
-        modeling_realm
-        parent_experiment_id
-        parent_experiment_rip
-        physics_version
-        product
-        project_id
-        realization
-        source
-        table_id
-        tracking_id
-    '''.split())
+    return missing_global_attrs(nc, cmip5_global_attrs)
+
+
+cf_global_attrs = '''
+    title
+    institution
+    source
+    history
+    references
+    comment
+'''.split()
 
 
 @is_a_check
+@only_reads_header
 def missing_cf_global_attrs(nc):
     """Checks if any CF Metadata Convention global attribute is missing.
     Reference: http://cfconventions.org/cf-conventions/v1.6.0/cf-conventions.html#description-of-file-contents
     """
-    return missing_global_attrs(nc, '''
-        title
-        institution
-        source
-        history
-        references
-        comment
-    '''.split())
+    return missing_global_attrs(nc, cf_global_attrs)
 
 
 # Mandatory and optional summary global attributes describing GCM output that the PCIC metdata standard uses when
@@ -213,28 +964,33 @@ hydromodel_specific_optional_global_attrs = '''
 '''.split()
 
 
+pcic_common_mandatory_global_attrs = '''
+    contact
+    Conventions
+    creation_date
+    frequency
+    institute_id
+    institution
+    modeling_realm
+    product
+    project_id
+    table_id
+    title
+'''.split()
+
+
 @is_a_check
+@only_reads_header
 def missing_pcic_common_mandatory_global_attrs(nc):
     """Checks if any mandatory global attribute common to all PCIC data files is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
     Table A.
     """
-    return missing_global_attrs(nc, '''
-        contact
-        Conventions
-        creation_date
-        frequency
-        institute_id
-        institution
-        modeling_realm
-        product
-        project_id
-        table_id
-        title
-    '''.split())
+    return missing_global_attrs(nc, pcic_common_mandatory_global_attrs)
 
 
 @is_a_check
+@only_reads_header
 def missing_downscaling_specific_mandatory_global_attrs(nc):
     """Checks if any mandatory global metadata attribute describing downscaling is missing.
     This check only checks for downscaling-specific attributes; additional attributes are required to fully describe
@@ -246,6 +1002,7 @@ def missing_downscaling_specific_mandatory_global_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_downscaling_mandatory_global_attrs(nc):
     """Checks if any mandatory global metadata attribute for downscaled model products is missing.
     This checks the complete set of mandatory global attributes for a downscaled output file.
@@ -255,23 +1012,26 @@ def missing_downscaling_mandatory_global_attrs(nc):
     return missing_pcic_common_mandatory_global_attrs(nc) + missing_downscaling_specific_mandatory_global_attrs(nc)
 
 
+downscaling_optional_global_attrs = \
+    downscaling_specific_optional_global_attrs + \
+    '''
+        domain
+        tracking_id
+    '''.split()
+
+
 @is_a_check
+@only_reads_header
 def missing_downscaling_optional_global_attrs(nc):
     """Checks if any optional global metadata attribute for a downscaled output file is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
     Tables A & B
     """
-    return missing_global_attrs(
-        nc, 
-        downscaling_specific_optional_global_attrs +
-        '''
-            domain
-            tracking_id
-        '''.split()
-    )
+    return missing_global_attrs(nc, downscaling_optional_global_attrs)
 
 
 @is_a_check
+@only_reads_header
 def missing_downscaling_any_global_attrs(nc):
     """Checks if any mandatory OR optional global metadata attribute for downscaled model products is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
@@ -280,29 +1040,38 @@ def missing_downscaling_any_global_attrs(nc):
     return missing_downscaling_mandatory_global_attrs(nc) + missing_downscaling_optional_global_attrs(nc)
 
 
+model_forcing_general_mandatory_global_attrs = '''
+    forcing_type
+'''.split()
+
+
 @is_a_check
+@only_reads_header
 def missing_model_forcing_general_mandatory_attrs(nc):
     """Checks if any mandatory global metadata attribute describing general model forcing is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
     Table C1
     """
-    return missing_global_attrs(nc, '''
-        forcing_type
-    '''.split())
+    return missing_global_attrs(nc, model_forcing_general_mandatory_global_attrs)
+
+
+model_forcing_general_optional_global_attrs = '''
+    forcing_domain
+'''.split()
 
 
 @is_a_check
+@only_reads_header
 def missing_model_forcing_general_optional_attrs(nc):
     """Checks if any optional global metadata attribute describing general model forcing is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
     Table C1
     """
-    return missing_global_attrs(nc, '''
-        forcing_domain
-    '''.split())
+    return missing_global_attrs(nc, model_forcing_general_optional_global_attrs)
 
 
 @is_a_check
+@only_reads_header
 def missing_model_forcing_observational_mandatory_attrs(nc):
     """Checks if any mandatory global metadata attribute describing model forcing by observational data is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
@@ -313,6 +1082,7 @@ def missing_model_forcing_observational_mandatory_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_model_forcing_observational_optional_attrs(nc):
     """Checks if any optional global metadata attribute describing model forcing by observational data is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
@@ -323,6 +1093,7 @@ def missing_model_forcing_observational_optional_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_model_forcing_downscaled_gcm_mandatory_attrs(nc):
     """Checks if any mandatory global metadata attribute describing model forcing by downscaled gcm data is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
@@ -333,6 +1104,7 @@ def missing_model_forcing_downscaled_gcm_mandatory_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_model_forcing_downscaled_gcm_optional_attrs(nc):
     """Checks if any optional global metadata attribute describing model forcing by downscaled gcm data is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
@@ -343,6 +1115,7 @@ def missing_model_forcing_downscaled_gcm_optional_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_calibration_mandatory_attrs(nc):
     """Checks if any mandatory global metadata attribute describing model calibration dataset is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
@@ -353,6 +1126,7 @@ def missing_calibration_mandatory_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_model_calibration_optional_attrs(nc):
     """Checks if any optional global metadata attribute describing model calibration dataset is missing.
     Reference: https://pcic.uvic.ca/confluence/display/CSG/PCIC+metadata+standard+for+downscaled+data+and+hydrology+modelling+data
@@ -362,6 +1136,7 @@ def missing_model_calibration_optional_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_hydromodel_specific_mandatory_global_attrs(nc):
     """Checks if any mandatory global metadata attribute specific to hydrological models is missing.
     This check only checks for hydromodel-specific attributes; additional attributes are required to fully describe
@@ -373,6 +1148,7 @@ def missing_hydromodel_specific_mandatory_global_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_hydromodel_specific_optional_global_attrs(nc):
     """Checks if any optional global metadata attribute specific to hydrological models is missing.
     This check only checks for hydromodel-specific attributes; additional attributes are required to fully describe
@@ -384,6 +1160,7 @@ def missing_hydromodel_specific_optional_global_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_hydromodel_obs_mandatory_global_attrs(nc):
     """Checks if any mandatory global metadata attribute for hydrological modelling output products is missing.
     This check is the full deal -- all attributes needed for an output file from a hydromodel forced by observations.
@@ -398,6 +1175,7 @@ def missing_hydromodel_obs_mandatory_global_attrs(nc):
 
 
 @is_a_check
+@only_reads_header
 def missing_hydromodel_gcm_mandatory_global_attrs(nc):
     """Checks if any mandatory global metadata attribute for hydrological modelling output products is missing.
     This check is the full deal -- all attributes needed for an output file from a hydromodel forced by observations.
@@ -412,6 +1190,7 @@ def missing_hydromodel_gcm_mandatory_global_attrs(nc):
 
 
 @is_a_check
+@reads_data
 def cant_generate_climos(nc):
     """Checks to see if the generate_climos script will fail (raise an
     exception) due to metadata when run.
@@ -432,7 +1211,15 @@ def cant_generate_climos(nc):
     return False
 
 
+def _has_masked_dimensions_reads(nc):
+    return [(varname, bounds) for varname in coordinate_variables(nc)
+            for bounds in variable_tiles(nc.variables[varname])]
+
+
 @is_a_check
+@reads_data
+@can_read_mapped
+@plans_reads(_has_masked_dimensions_reads)
 def has_masked_dimensions(nc):
     """Checks for any dimension variables that have masked values.
 
@@ -442,58 +1229,3115 @@ def has_masked_dimensions(nc):
     when processing the file. Specifically, a masked time variable causes
     ``generate_climos`` (entirely reasonably) to omit any masked time period
     and/or to not be able to determine the time resolution of the file.
+
+    Dimensions without a dimension (coordinate) variable are skipped.
     """
-    return [
-        dim for dim in nc.dimensions
-        if isinstance(nc.variables[dim][:], numpy.ma.core.MaskedArray)
-    ]
+    return [dim for dim in coordinate_variables(nc) if has_masked_values(nc, dim)]
 
 
+# Time axis checks. The time values are read once per file (see
+# `time_axis`), in tiles, and shared by all of these checks, which work on
+# them with whole-array numpy operations.
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument('files', metavar='FILE', type=str, nargs='*',
-            help='File to check for missing layer')
-    parser.add_argument('-c', '--checks', default='layer_one_missing',
-            help='Comma separated list of check names to be performed')
-    parser.add_argument('-l', '--list_checks', action='store_true',
-            help='List the names of all available checks and exit',
-            default=False)
-    parser.add_argument('-v', '--verbose', action='store_true',
-            help='Provide more detail about available checks and check failures',
-            default=False)
+# Time steps, in days, of the fixed-length `frequency` attribute values
+fixed_frequency_days = {
+    '1hr': 1 / 24., '1hrPt': 1 / 24., 'hr': 1 / 24., '3hr': 0.125, '3hrPt': 0.125,
+    '6hr': 0.25, '6hrPt': 0.25, 'day': 1.,
+}
+# Time steps, in calendar months, of the `frequency` attribute values that
+# vary in length
+calendar_frequency_months = {'mon': 1, 'yr': 12, 'yrPt': 12, 'dec': 120}
+# Days in the time units that need no calendar to convert
+unit_days = {
+    'days': 1., 'day': 1., 'd': 1., 'hours': 1 / 24., 'hour': 1 / 24., 'hrs': 1 / 24.,
+    'h': 1 / 24., 'minutes': 1 / 1440., 'minute': 1 / 1440., 'min': 1 / 1440.,
+    'seconds': 1 / 86400., 'second': 1 / 86400., 'sec': 1 / 86400., 's': 1 / 86400.,
+}
+# Time steps differing from the expected step by less than this fraction
+# of it are regular
+time_step_tolerance = 1e-3
+# Most time indices that a time axis check reports
+max_reported_times = 20
 
-    args = parser.parse_args()
 
-    if args.list_checks:
-        if args.verbose:
-            for check_name in check_list:
-                check = globals()[check_name]
-                print('{}:\n{}\n'.format(check_name, check.__doc__))
-        else:
-            print("Available checks:", ','.join(check_list))
-        sys.exit(0)
+class TimeAxis(object):
+    '''The values of a file's time variable, with what the time axis
+    checks work out from them (each worked out once, when first needed).
 
-    checks = []
-    for check in args.checks.split(','):
-        if check not in check_list:
-            print("NetCDF check '{}' does not exist".format(check), file=sys.stderr)
-            sys.exit(1)
-        checks.append(globals()[check])
+    `values` are the raw values (NaN where masked, so that no comparison
+    with a masked value holds), `steps` the differences between
+    consecutive values, `units`, `calendar` and `frequency` the time
+    variable's units and calendar and the file's frequency attribute.
+    '''
 
-    exit_status = 0
-    for file_ in args.files:
-        nc = nchelpers.CFDataset(file_, 'r')
-        for check in checks:
-            result = check(nc)
-            if result:
-                exit_status = 1
-                if args.verbose:
-                    print('{} FAILED {}: {}'.format(file_, check.__name__, result))
-                else:
-                    print(file_)
-                    # In non-verbose mode, we only care whether a file is
-                    # good/bad. If it fails, skip the rest of the checks
-                    break
+    def __init__(self, values, units, calendar, frequency):
+        import numpy
+
+        self.values = values
+        self.steps = numpy.diff(values)
+        self.units = units
+        self.calendar = calendar
+        self.frequency = frequency
+        self._day_steps = self._month_steps = None
+
+    def day_steps(self):
+        '''Returns the steps in days'''
+        if self._day_steps is None:
+            unit = self.units.split(' since ', 1)[0].strip().lower()
+            if unit in unit_days:
+                self._day_steps = self.steps * unit_days[unit]
+            else:
+                import numpy
+                import cftime
+
+                self._day_steps = numpy.diff(self._decoded(
+                    lambda dates: cftime.date2num(dates, summary_time_units, self.calendar)))
+        return self._day_steps
+
+    def month_steps(self):
+        '''Returns the steps in calendar months (between the months of the
+        dates, whatever their days)'''
+        if self._month_steps is None:
+            import numpy
+
+            self._month_steps = numpy.diff(self._decoded(
+                lambda dates: [date.year * 12 + date.month for date in dates]))
+        return self._month_steps
+
+    def _decoded(self, convert):
+        # Applies `convert` to the dates of the (unmasked) values
+        import numpy
+        import cftime
+
+        result = numpy.full(len(self.values), numpy.nan)
+        valid = ~numpy.isnan(self.values)
+        if valid.any():
+            dates = cftime.num2date(self.values[valid], self.units, self.calendar)
+            result[valid] = convert(dates)
+        return result
+
+    def expected_day_step(self):
+        '''Returns the step, in days, that the frequency attribute calls for,
+        or if it doesn't give a fixed-length step, the median step; None
+        if there is none'''
+        if self.frequency in fixed_frequency_days:
+            return fixed_frequency_days[self.frequency]
+        import numpy
+
+        steps = self.day_steps()
+        steps = steps[steps > 0]
+        return float(numpy.median(steps)) if len(steps) else None
+
+
+def time_axis(nc):
+    '''Returns the TimeAxis of open NetCDF file `nc`, or None if it has no
+    one-dimensional time variable with units. The time variable is read,
+    in tiles, only once per file.'''
+    state = file_state(nc)
+    if 'time_axis' not in state:
+        state['time_axis'] = _read_time_axis(nc)
+    return state['time_axis']
+
+
+def _time_axis_variable(nc):
+    var_ = time_variable(nc)
+    if var_ is None or len(var_.dimensions) != 1 or not hasattr(var_, 'units'):
+        return None
+    return var_
+
+
+def _time_axis_reads(nc):
+    var_ = _time_axis_variable(nc)
+    if var_ is None:
+        return []
+    return [(var_.name, bounds) for bounds in variable_tiles(var_)]
+
+
+def _read_time_axis(nc):
+    import numpy
+
+    var_ = _time_axis_variable(nc)
+    if var_ is None:
+        return None
+    planner = read_planner(nc)
+    rules = masking_rules(var_)
+    values = numpy.empty(var_.shape[0], dtype='f8')
+    for bounds in variable_tiles(var_):
+        (start, stop), = bounds
+        raw = planner.read(var_.name, bounds)
+        values[start:stop] = raw
+        if rules is not None:
+            values[start:stop][masked_values(raw, rules)] = numpy.nan
+    frequency = nc.getncattr('frequency') if 'frequency' in global_attr_names(nc) else None
+    return TimeAxis(values, var_.units, getattr(var_, 'calendar', 'standard'), frequency)
+
+
+def _reported(indices):
+    return [int(index) for index in indices[:max_reported_times]]
+
+
+@is_a_check
+@reads_data
+@plans_reads(_time_axis_reads)
+def time_not_monotonic(nc):
+    '''Checks for time values that are less than the one before them
+
+    Returns the indices of (up to max_reported_times of) those values.
+    '''
+    axis = time_axis(nc)
+    if axis is None:
+        return []
+    import numpy
+
+    return _reported(numpy.flatnonzero(axis.steps < 0) + 1)
+
+
+@is_a_check
+@reads_data
+@plans_reads(_time_axis_reads)
+def duplicate_times(nc):
+    '''Checks for time values that occur more than once
+
+    Returns the indices of (up to max_reported_times of) the repeats,
+    after the first occurrence of each value.
+    '''
+    axis = time_axis(nc)
+    if axis is None:
+        return []
+    import numpy
+
+    if (axis.steps >= 0).all():
+        # Sorted, so any repeats are next to one another
+        return _reported(numpy.flatnonzero(axis.steps == 0) + 1)
+    valid = numpy.flatnonzero(~numpy.isnan(axis.values))
+    _, first = numpy.unique(axis.values[valid], return_index=True)
+    repeated = numpy.ones(len(valid), dtype=bool)
+    repeated[first] = False
+    return _reported(valid[repeated])
+
+
+def _step_findings(indices, steps):
+    return [(int(index) + 1, round(float(steps[index]), 6))
+            for index in indices[:max_reported_times]]
+
+
+@is_a_check
+@reads_data
+@plans_reads(_time_axis_reads)
+def time_gaps(nc):
+    '''Checks for gaps in the time axis: steps longer than the file's
+    frequency attribute calls for
+
+    For monthly, yearly and decadal frequencies, consecutive times should
+    be a month, year or decade apart in calendar months, whatever the
+    calendar; for the others, steps should be the length the frequency
+    gives. Files without a known frequency are checked against their
+    median step.
+    Returns (index, step) pairs for (up to max_reported_times of) the
+    times following a gap, with steps in calendar months for monthly and
+    longer frequencies and in days otherwise.
+    '''
+    axis = time_axis(nc)
+    if axis is None or not len(axis.steps):
+        return []
+    import numpy
+
+    if axis.frequency in calendar_frequency_months:
+        steps = axis.month_steps()
+        return _step_findings(
+            numpy.flatnonzero(steps > calendar_frequency_months[axis.frequency]), steps)
+    expected = axis.expected_day_step()
+    if not expected:
+        return []
+    steps = axis.day_steps()
+    return _step_findings(numpy.flatnonzero(steps > 1.5 * expected), steps)
 
-    sys.exit(exit_status)
\ No newline at end of file
+
+@is_a_check
+@reads_data
+@plans_reads(_time_axis_reads)
+def irregular_time_steps(nc):
+    '''Checks for time steps that are neither the length the file's
+    frequency calls for nor a gap (see time_gaps)
+
+    For monthly, yearly and decadal frequencies, these are times less
+    than a month, year or decade (in calendar months) after the one
+    before; their steps in days vary with the calendar, so are not
+    compared. For the other frequencies, they are steps (not decreasing
+    or repeated ones) differing from the expected step by more than
+    time_step_tolerance of it. Returns (index, step in days) pairs for
+    (up to max_reported_times of) the times ending such a step.
+    '''
+    axis = time_axis(nc)
+    if axis is None or not len(axis.steps):
+        return []
+    import numpy
+
+    steps = axis.day_steps()
+    if axis.frequency in calendar_frequency_months:
+        period = calendar_frequency_months[axis.frequency]
+        months = axis.month_steps()
+        irregular = (axis.steps > 0) & (months < period)
+        return _step_findings(numpy.flatnonzero(irregular), steps)
+    expected = axis.expected_day_step()
+    if not expected:
+        return []
+    irregular = ((axis.steps > 0) & (steps <= 1.5 * expected) &
+                 (numpy.abs(steps - expected) > time_step_tolerance * expected))
+    return _step_findings(numpy.flatnonzero(irregular), steps)
+
+
+# Storage layout checks. These estimate, from metadata alone, what the two
+# common ways of reading a grid variable cost: a time series at one point
+# (var[:, y, x]) and a map at one time (var[t]). A read costs the bytes of
+# every chunk it touches, whole (compression is ignored), plus
+# read_overhead_bytes for each separate read, standing for a seek or a
+# chunk lookup. Its amplification is its cost over the bytes it returns.
+# Some amplification is unavoidable, so a layout is only reported as slow
+# for a read that would cost much less with the suggested chunk shape.
+
+read_overhead_bytes = 2 ** 16
+# Reads are slow if they cost this many times what they would with the
+# suggested chunk shape, and more than slow_read_cost_bytes
+slow_read_factor = 10
+slow_read_cost_bytes = 2 ** 26
+# Chunk cache size assumed where a variable's can't be found
+default_chunk_cache_bytes = 2 ** 22
+# Variables larger than this should be chunked and compressed
+large_uncompressed_bytes = 2 ** 30
+# Filters (as named by netCDF4's Variable.filters) that compress
+compression_filters = ('zlib', 'szip', 'zstd', 'bzip2', 'blosc')
+# Target size of suggested chunks
+chunk_target_bytes = 2 ** 20
+
+
+def _itemsize(var_):
+    '''Returns the size in bytes of a value of variable `var_`, or None if
+    it isn't of a fixed size type'''
+    dtype = var_.dtype
+    if hasattr(dtype, 'itemsize'):
+        return dtype.itemsize
+    try:
+        return int(str(dtype)[1:])
+    except ValueError:
+        return None
+
+
+def var_chunks(var_):
+    '''Returns the chunk shape of variable `var_`, or None if it is stored
+    contiguously (as all classic format variables are)'''
+    try:
+        chunks = var_.chunking()
+    except Exception:
+        return None
+    return tuple(chunks) if isinstance(chunks, (list, tuple)) else None
+
+
+def read_cost(var_shape, itemsize, chunks, shape, record_stride=None):
+    '''Returns the estimated (cost in bytes, number of reads) of reading a
+    block of `shape` from the origin of a variable of `var_shape` with
+    values of `itemsize` bytes, stored in `chunks`, or contiguously (with
+    records `record_stride` bytes apart, for a classic format record
+    variable) if `chunks` is None'''
+    if chunks is None:
+        # The block is in runs, contiguous in the file: its extent in the
+        # innermost dimension it doesn't fill, and all of every dimension
+        # inside that. Runs closer than a read's overhead are read through.
+        inner = len(shape)
+        while inner > 0 and shape[inner - 1] == var_shape[inner - 1]:
+            inner -= 1
+        run = _product(shape[max(0, inner - 1):]) * itemsize
+        outer = [dim for dim in range(inner - 1) if shape[dim] > 1]
+        if not outer:
+            return run + read_overhead_bytes, 1
+        if outer[-1] == 0 and record_stride:
+            # Records of a classic format record variable are interleaved
+            stride = record_stride
+        else:
+            stride = _product(var_shape[outer[-1] + 1:]) * itemsize
+        runs = _product(shape[:inner - 1])
+        if stride - run < read_overhead_bytes:
+            return (runs - 1) * stride + run + read_overhead_bytes, 1
+        return runs * (run + read_overhead_bytes), runs
+    touched = _product(-(-size // chunk) for size, chunk in zip(shape, chunks))
+    return touched * (_product(chunks) * itemsize + read_overhead_bytes), touched
+
+
+def access_patterns(var_):
+    '''Returns the shapes of a time series read and a map read of variable
+    `var_`, indexed by pattern'''
+    shape = var_.shape
+    return collections.OrderedDict([
+        ('timeseries', (shape[0],) + (1,) * (len(shape) - 1)),
+        ('map', (1,) + tuple(shape[1:])),
+    ])
+
+
+def read_amplification(var_, shape, chunks=False):
+    '''Returns the estimated (amplification, cost in bytes) of reading a
+    block of `shape` from variable `var_`, as it is stored or, if given,
+    stored in `chunks` (None meaning contiguously)'''
+    itemsize = _itemsize(var_)
+    if chunks is False:
+        chunks = var_chunks(var_)
+    cost, _ = read_cost(var_.shape, itemsize, chunks, shape, getattr(var_, 'record_stride', None))
+    return cost / float(_product(shape) * itemsize), cost
+
+
+def balanced_chunks(shape, itemsize, target_bytes=None):
+    '''Returns a chunk shape for an array of `shape` (time first) of about
+    `target_bytes` (default `chunk_target_bytes`) that makes time series and
+    map reads touch about the same number of chunks: with N chunks in
+    all, sqrt(N) each, the spatial dimensions being divided evenly'''
+    if target_bytes is None:
+        target_bytes = chunk_target_bytes
+    values = _product(shape)
+    chunk_values = max(1, target_bytes // itemsize)
+    if values <= chunk_values:
+        return tuple(shape)
+    per_pattern = math.sqrt(values / float(chunk_values))
+    time_chunk = shape[0] / per_pattern
+    spatial_divisor = per_pattern ** (1.0 / max(1, len(shape) - 1))
+    chunks = [time_chunk] + [size / spatial_divisor for size in shape[1:]]
+    return tuple(max(1, min(size, int(round(chunk)))) for size, chunk in zip(shape, chunks))
+
+
+def layout_variables(nc):
+    '''Returns the grid variables of `nc` whose layouts can be assessed (of
+    a fixed size type, with no empty dimension)'''
+    return [varname for varname in grid_variables(nc)
+            if _itemsize(nc.variables[varname]) and all(nc.variables[varname].shape)]
+
+
+def _layout_finding(var_, amplification):
+    return (var_.name, round(amplification, 1),
+            balanced_chunks(var_.shape, _itemsize(var_)))
+
+
+def slow_reads(nc, pattern):
+    '''Returns the (variable name, amplification, suggested chunk shape)
+    of each grid variable of `nc` that is slow to read in `pattern`'''
+    findings = []
+    for varname in layout_variables(nc):
+        var_ = nc.variables[varname]
+        shape = access_patterns(var_)[pattern]
+        amplification, cost = read_amplification(var_, shape)
+        if cost <= slow_read_cost_bytes:
+            continue
+        _, balanced_cost = read_amplification(
+            var_, shape, balanced_chunks(var_.shape, _itemsize(var_)))
+        if cost > slow_read_factor * balanced_cost:
+            findings.append(_layout_finding(var_, amplification))
+    return findings
+
+
+@is_a_check
+@only_reads_header
+def slow_timeseries_chunking(nc):
+    '''Checks for grid variables that are slow to read as time series
+
+    Reading the whole time series at one point, e.g. for time series
+    extraction, is slow when each time step is in a different chunk (such
+    as the common one chunk per time step layout) or, in a contiguous
+    variable, far from the next. Returns a (variable, estimated read
+    amplification, suggested chunk shape) tuple for each variable that
+    would be much quicker to read with the suggested chunk shape.
+    '''
+    return slow_reads(nc, 'timeseries')
+
+
+@is_a_check
+@only_reads_header
+def slow_map_chunking(nc):
+    '''Checks for grid variables that are slow to read one time step at a
+    time
+
+    Reading the map at one time step, e.g. by a tile server, is slow when
+    chunks span many time steps (such as time-major chunks) or are tiny.
+    Returns a (variable, estimated read amplification, suggested chunk
+    shape) tuple for each variable that would be much quicker to read
+    with the suggested chunk shape.
+    '''
+    return slow_reads(nc, 'map')
+
+
+@is_a_check
+@only_reads_header
+def oversized_chunks(nc):
+    '''Checks for grid variables with chunks larger than their chunk cache
+
+    A chunk that doesn't fit in the netCDF library's chunk cache is read
+    (and decompressed) again for every access to it. Returns a (variable,
+    estimated read amplification of its slower access pattern, suggested
+    chunk shape) tuple for each such variable.
+    '''
+    findings = []
+    for varname in layout_variables(nc):
+        var_ = nc.variables[varname]
+        chunks = var_chunks(var_)
+        if chunks is None:
+            continue
+        try:
+            cache_bytes = var_.get_var_chunk_cache()[0]
+        except Exception:
+            cache_bytes = default_chunk_cache_bytes
+        if _product(chunks) * _itemsize(var_) > cache_bytes:
+            amplification = max(read_amplification(var_, shape)[0]
+                                for shape in access_patterns(var_).values())
+            findings.append(_layout_finding(var_, amplification))
+    return findings
+
+
+def is_compressed(var_):
+    '''Returns True if variable `var_` is stored with a compression filter'''
+    try:
+        filters = var_.filters()
+    except Exception:
+        return False
+    return any(filters.get(name) for name in compression_filters) if filters else False
+
+
+@is_a_check
+@only_reads_header
+def large_uncompressed_variables(nc):
+    '''Checks for large grid variables stored without compression
+
+    Uncompressed variables take more I/O to read, and one stored
+    contiguously (as in any classic format file) can't be compressed and
+    takes a seek per time step to read as time series. Returns a
+    (variable, estimated time series read amplification, suggested chunk
+    shape) tuple for each grid variable larger than 1 GiB that is stored
+    contiguously or chunked without compression.
+    '''
+    findings = []
+    for varname in layout_variables(nc):
+        var_ = nc.variables[varname]
+        if (_product(var_.shape) * _itemsize(var_) > large_uncompressed_bytes and
+                not is_compressed(var_)):
+            amplification, _ = read_amplification(var_, access_patterns(var_)['timeseries'])
+            findings.append(_layout_finding(var_, amplification))
+    return findings
+
+
+@is_a_check
+@only_reads_header
+def non_native_endianness(nc):
+    '''Checks for variables stored in the other byte order to this machine's
+
+    Every value read from such a variable has to be byte swapped. Returns
+    a (variable, byte order) tuple for each. Classic format files are big
+    endian by definition, so are not reported.
+    '''
+    findings = []
+    for varname, var_ in nc.variables.items():
+        try:
+            endian = var_.endian()
+        except Exception:
+            continue
+        if endian not in ('native', sys.byteorder):
+            findings.append((varname, endian))
+    return findings
+
+
+# Cross-file checks. These see a compact summary of each file checked (see
+# file_summary), gathered while it is checked and kept in a MetadataIndex,
+# and are run once all the files have been checked, without reopening any.
+
+# Global attributes kept in file summaries
+summary_attrs = ('tracking_id', 'driving_model_id', 'driving_realization', 'model_id', 'realization')
+# Global attributes that should be the same for all the files of a run (a
+# directory)
+run_attrs = ('driving_model_id', 'driving_realization', 'model_id', 'realization')
+# Units to which file summaries convert times, so that files can be compared
+summary_time_units = 'days since 1850-01-01'
+# The name under which file summaries are kept in the result cache
+summary_cache_name = '(summary)'
+
+
+def time_variable(nc):
+    '''Returns the time variable of `nc`, or None if it has none'''
+    try:
+        return nc.time_var
+    except Exception:
+        return nc.variables.get('time')
+
+
+def file_summary(nc):
+    '''Returns a compact summary of open NetCDF file `nc` for the cross-file
+    checks: the values of `summary_attrs` (None for those missing), the
+    names of its grid variables, and the calendar, start, end and step of
+    its time axis in `summary_time_units` (None if it has none).'''
+    attrs = global_attr_names(nc)
+    values = tuple(sys.intern(str(nc.getncattr(attr))) if attr in attrs else None
+                   for attr in summary_attrs)
+    variables = sys.intern(','.join(sorted(grid_variables(nc))))
+    try:
+        time = _time_summary(time_variable(nc))
+    except Exception:
+        # A time axis that can't be read or decoded is left out of the
+        # time checks
+        time = None
+    return values, variables, time
+
+
+def _time_summary(time_var):
+    if time_var is None or len(time_var.shape) != 1 or not time_var.shape[0]:
+        return None
+    import numpy
+    import cftime
+
+    calendar = getattr(time_var, 'calendar', 'standard')
+    size = time_var.shape[0]
+    values = numpy.ma.concatenate([time_var[:2], time_var[size - 1:]])
+    if numpy.ma.is_masked(values):
+        # A masked start, end or step can't be summarized
+        return None
+    values = numpy.ma.getdata(values)
+    raw = [values[0], values[min(1, size - 1)], values[-1]]
+    start, second, end = cftime.date2num(
+        cftime.num2date(raw, time_var.units, calendar), summary_time_units, calendar)
+    step = second - start if size > 1 else float('nan')
+    return sys.intern(str(calendar)), float(start), float(end), float(step)
+
+
+class MetadataIndex(object):
+    '''The summaries (see `file_summary`) of all the files checked, for the
+    cross-file checks.
+
+    Repeated values (attribute values, variable lists, calendars) are
+    stored once, with each file holding small integer codes for them, and
+    times are stored in arrays, so the index stays small for a very large
+    number of files.
+    '''
+
+    def __init__(self):
+        self.paths = []
+        self.codes = {None: 0}
+        self.values = [None]
+        self.columns = {name: array.array('l') for name in summary_attrs + ('variables', 'calendar')}
+        self.times = {name: array.array('d') for name in ('start', 'end', 'step')}
+
+    def code(self, value):
+        if value not in self.codes:
+            self.codes[value] = len(self.values)
+            self.values.append(value)
+        return self.codes[value]
+
+    def add(self, path, summary):
+        '''Adds the `summary` of file `path` (if None, e.g. because the
+        file couldn't be opened, the file is left out)'''
+        if summary is None:
+            return
+        values, variables, time = summary
+        calendar, start, end, step = time or (None, float('nan'), float('nan'), float('nan'))
+        self.paths.append(path)
+        for attr, value in zip(summary_attrs, values):
+            self.columns[attr].append(self.code(value))
+        self.columns['variables'].append(self.code(variables))
+        self.columns['calendar'].append(self.code(calendar))
+        self.times['start'].append(start)
+        self.times['end'].append(end)
+        self.times['step'].append(step)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def value(self, column, index):
+        '''Returns the value of `column` for the file at `index`'''
+        return self.values[self.columns[column][index]]
+
+    def groups(self, *columns):
+        '''Returns the indices of the files, grouped by directory and the
+        values of `columns`, as a dict of lists'''
+        groups = collections.defaultdict(list)
+        for index, path in enumerate(self.paths):
+            key = (os.path.dirname(path),) + tuple(self.columns[column][index] for column in columns)
+            groups[key].append(index)
+        return groups
+
+    def run(self, check_names):
+        '''Runs the named cross-file checks (others are ignored), returning
+        a list of (file, CheckResult) pairs, one for each finding'''
+        results = []
+        for check_name in check_names:
+            if check_name in aggregate_check_list:
+                for path, value in globals()[check_name](self):
+                    results.append((path, CheckResult(check_name, value)))
+        return results
+
+
+@is_a_check
+@checks_across_files
+def duplicate_tracking_ids(index):
+    '''Checks for files with the same tracking_id as another
+
+    A tracking_id should identify one file. Reports, for each file
+    sharing its tracking_id, the other files that have it.
+    '''
+    by_code = collections.defaultdict(list)
+    for position, code in enumerate(index.columns['tracking_id']):
+        if code:
+            by_code[code].append(position)
+    findings = []
+    for positions in by_code.values():
+        if len(positions) > 1:
+            for position in positions:
+                findings.append((index.paths[position],
+                                 [index.paths[other] for other in positions if other != position]))
+    return findings
+
+
+@is_a_check
+@checks_across_files
+def inconsistent_run_attrs(index):
+    '''Checks for files whose run metadata differs from the rest of their
+    directory's
+
+    The files of one run (directory) should share their driving model and
+    realization. Reports, for each file that differs from the most common
+    values in its directory, a dict of its differing attributes and
+    their (value, most common value) pairs.
+    '''
+    findings = []
+    for indices in index.groups().values():
+        for attr in run_attrs:
+            counts = collections.Counter(index.columns[attr][i] for i in indices)
+            if len(counts) < 2:
+                continue
+            common = counts.most_common(1)[0][0]
+            for i in indices:
+                if index.columns[attr][i] != common:
+                    findings.append((index.paths[i], {
+                        attr: (index.value(attr, i), index.values[common])
+                    }))
+    return findings
+
+
+def _consecutive_files(index):
+    '''Yields (previous, next) pairs of the indices of consecutive files (by
+    time) of the same variables and calendar in each directory'''
+    starts = index.times['start']
+    for indices in index.groups('variables', 'calendar').values():
+        timed = sorted((i for i in indices if starts[i] == starts[i]), key=lambda i: starts[i])
+        for previous, next_ in zip(timed, timed[1:]):
+            yield previous, next_
+
+
+@is_a_check
+@checks_across_files
+def overlapping_time_axes(index):
+    '''Checks for files of a variable whose time axes overlap
+
+    Consecutive files of the same variables in a directory should follow
+    on from one another in time. Reports, for each file that starts
+    before the previous one ends, the previous file and how much they
+    overlap, in days.
+    '''
+    start, end = index.times['start'], index.times['end']
+    return [(index.paths[next_], (index.paths[previous], end[previous] - start[next_]))
+            for previous, next_ in _consecutive_files(index) if start[next_] <= end[previous]]
+
+
+@is_a_check
+@checks_across_files
+def time_axis_gaps(index):
+    '''Checks for gaps between the time axes of files of a variable
+
+    Consecutive files of the same variables in a directory should follow
+    on from one another in time. Reports, for each file that starts more
+    than one and a half time steps after the previous one ends, the
+    previous file and the gap, in days.
+    '''
+    start, end, step = index.times['start'], index.times['end'], index.times['step']
+    findings = []
+    for previous, next_ in _consecutive_files(index):
+        steps = [value for value in (step[previous], step[next_]) if value == value]
+        gap = start[next_] - end[previous]
+        if steps and gap > 1.5 * max(steps):
+            findings.append((index.paths[next_], (index.paths[previous], gap)))
+    return findings
+
+
+# Header-only access to classic format (CDF-1, CDF-2 and CDF-5) files.
+# Reference: https://www.unidata.ucar.edu/software/netcdf/docs/file_format_specifications.html
+
+_NC_DIMENSION = 10
+_NC_VARIABLE = 11
+_NC_ATTRIBUTE = 12
+
+# nc_type -> (struct format character, numpy type string)
+_nc_types = {
+    1: ('b', 'i1'),
+    2: ('c', 'S1'),
+    3: ('h', 'i2'),
+    4: ('i', 'i4'),
+    5: ('f', 'f4'),
+    6: ('d', 'f8'),
+    7: ('B', 'u1'),
+    8: ('H', 'u2'),
+    9: ('I', 'u4'),
+    10: ('q', 'i8'),
+    11: ('Q', 'u8'),
+}
+
+_classic_formats = {
+    1: 'NETCDF3_CLASSIC',
+    2: 'NETCDF3_64BIT_OFFSET',
+    5: 'NETCDF3_64BIT_DATA',
+}
+
+_STREAMING = 0xFFFFFFFF
+
+
+class HeaderDimension(object):
+    '''A dimension read from a classic format header'''
+
+    def __init__(self, name, size, unlimited):
+        self.name = name
+        self.size = size
+        self._unlimited = unlimited
+
+    def __len__(self):
+        return self.size
+
+    def isunlimited(self):
+        return self._unlimited
+
+
+class HeaderVariable(object):
+    '''A variable read from a classic format header.
+
+    Supports the parts of the netCDF4.Variable interface that only need
+    metadata: dimensions, shape, dtype and attribute access.
+    '''
+
+    def __init__(self, name, dimensions, shape, attrs, nc_type, vsize, begin, is_record):
+        self.name = name
+        self.dimensions = dimensions
+        self.shape = shape
+        self.ndim = len(shape)
+        self.dtype = _nc_types[nc_type][1]
+        self.nc_type = nc_type
+        self.vsize = vsize
+        self.begin = begin
+        self.is_record = is_record
+        # Bytes from one record of a record variable to the next
+        self.record_stride = None
+        self._attrs = attrs
+        self.file_map = None
+
+    def ncattrs(self):
+        return list(self._attrs)
+
+    def getncattr(self, name):
+        return self._attrs[name]
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_attrs'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def chunking(self):
+        return 'contiguous'
+
+    def filters(self):
+        return None
+
+    def endian(self):
+        return 'native'
+
+    def mapped(self):
+        '''Returns all of this variable's raw values as a numpy array that is
+        a view of the file mapped into memory (with the records of a record
+        variable strided), so indexing it reads straight from the page
+        cache and copies nothing'''
+        import numpy
+
+        dtype = numpy.dtype(self.dtype).newbyteorder('>')
+        if not all(self.shape):
+            return numpy.empty(self.shape, dtype)
+        if self.file_map is None:
+            raise ValueError('Variable {} has no file to read'.format(self.name))
+        strides = []
+        stride = dtype.itemsize
+        for size in reversed(self.shape):
+            strides.insert(0, stride)
+            stride *= size
+        if self.is_record:
+            strides[0] = self.record_stride
+        return numpy.ndarray(self.shape, dtype, buffer=self.file_map.get(), offset=self.begin,
+                             strides=tuple(strides))
+
+    def byte_ranges(self, bounds):
+        '''Returns the (offset, length) ranges of the file that hold block
+        `bounds` (a (start, stop) pair per dimension) of this variable'''
+        if any(stop <= start for start, stop in bounds):
+            return []
+        if self.is_record:
+            records, bounds, shape = range(*bounds[0]), bounds[1:], self.shape[1:]
+        else:
+            records, shape = [0], self.shape
+        # Each record holds the block's span, from its first to last element
+        first = last = 0
+        stride = 1
+        for size, (start, stop) in zip(reversed(shape), reversed(bounds)):
+            first += start * stride
+            last += (stop - 1) * stride
+            stride *= size
+        itemsize = struct.calcsize(_nc_types[self.nc_type][0])
+        return [(self.begin + (record * self.record_stride if self.is_record else 0) + first * itemsize,
+                 (last - first + 1) * itemsize) for record in records]
+
+
+class _FileMap(object):
+    '''A read-only memory map of the file at `path`, made when first needed'''
+
+    def __init__(self, path):
+        self.path = path
+        self.buffer = None
+
+    def get(self):
+        if self.buffer is None:
+            import mmap
+
+            with open(self.path, 'rb') as file_:
+                self.buffer = mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.buffer
+
+    def close(self):
+        if self.buffer is not None:
+            try:
+                self.buffer.close()
+            except BufferError:
+                # Arrays still view it; it is unmapped once they are gone
+                pass
+            self.buffer = None
+
+
+class HeaderDataset(object):
+    '''The header of a classic format NetCDF file.
+
+    Supports the parts of the netCDF4.Dataset interface that only need
+    metadata, so header-only checks can be run against it.
+    '''
+
+    def __init__(self, path, file_format, numrecs, dimensions, attrs, variables, file_map=None):
+        self.path = path
+        self.file_format = self.data_model = file_format
+        self.numrecs = numrecs
+        self.dimensions = dimensions
+        self.variables = variables
+        self._attrs = attrs
+        self.file_map = file_map
+
+    def filepath(self):
+        return self.path
+
+    def ncattrs(self):
+        return list(self._attrs)
+
+    def getncattr(self, name):
+        return self._attrs[name]
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_attrs'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def close(self):
+        if self.file_map is not None:
+            self.file_map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _HeaderParser(object):
+    '''Parses a classic format header from a binary file object'''
+
+    def __init__(self, file_, version):
+        self.file_ = file_
+        self.version = version
+
+    def read(self, size):
+        data = self.file_.read(size)
+        if len(data) != size:
+            raise ValueError('Truncated NetCDF header')
+        return data
+
+    def int32(self):
+        return struct.unpack('>i', self.read(4))[0]
+
+    def non_neg(self):
+        if self.version == 5:
+            return struct.unpack('>Q', self.read(8))[0]
+        return struct.unpack('>I', self.read(4))[0]
+
+    def offset(self):
+        if self.version == 1:
+            return struct.unpack('>I', self.read(4))[0]
+        return struct.unpack('>Q', self.read(8))[0]
+
+    def padded(self, size):
+        data = self.read(size)
+        self.read(-size % 4)
+        return data
+
+    def name(self):
+        return self.padded(self.non_neg()).decode('utf-8')
+
+    def list_header(self, expected_tag):
+        tag, nelems = self.int32(), self.non_neg()
+        if tag == 0 and nelems == 0:
+            return 0
+        if tag != expected_tag:
+            raise ValueError('Malformed NetCDF header: unexpected tag {}'.format(tag))
+        return nelems
+
+    def attrs(self):
+        attrs = collections.OrderedDict()
+        for _ in range(self.list_header(_NC_ATTRIBUTE)):
+            name = self.name()
+            nc_type = self.int32()
+            if nc_type not in _nc_types:
+                raise ValueError('Malformed NetCDF header: unknown type {}'.format(nc_type))
+            nelems = self.non_neg()
+            format_char, type_str = _nc_types[nc_type]
+            data = self.padded(nelems * struct.calcsize(format_char))
+            if nc_type == 2:
+                value = data.decode('utf-8', 'replace')
+            else:
+                value = list(struct.unpack('>{}{}'.format(nelems, format_char), data))
+                if len(value) == 1:
+                    value = value[0]
+            attrs[name] = value
+        return attrs
+
+    def parse(self, path, file_format):
+        numrecs = self.non_neg()
+        dims = []
+        for _ in range(self.list_header(_NC_DIMENSION)):
+            dims.append((self.name(), self.non_neg()))
+        attrs = self.attrs()
+        variables = collections.OrderedDict()
+        record_vars = []
+        for _ in range(self.list_header(_NC_VARIABLE)):
+            name = self.name()
+            dimids = [self.non_neg() for _ in range(self.non_neg())]
+            var_attrs = self.attrs()
+            nc_type = self.int32()
+            if nc_type not in _nc_types:
+                raise ValueError('Malformed NetCDF header: unknown type {}'.format(nc_type))
+            vsize = self.non_neg()
+            begin = self.offset()
+            try:
+                var_dims = [dims[dimid] for dimid in dimids]
+            except IndexError:
+                raise ValueError('Malformed NetCDF header: bad dimension id')
+            is_record = bool(var_dims) and var_dims[0][1] == 0
+            variables[name] = HeaderVariable(
+                name, tuple(dim_name for dim_name, _ in var_dims),
+                tuple(size for _, size in var_dims), var_attrs, nc_type, vsize, begin, is_record
+            )
+            if is_record:
+                record_vars.append(variables[name])
+        if numrecs == _STREAMING:
+            numrecs = self.streaming_numrecs(path, record_vars)
+        record_size = self.record_size(record_vars)
+        for var_ in record_vars:
+            var_.shape = (numrecs,) + var_.shape[1:]
+            var_.record_stride = record_size
+        dimensions = collections.OrderedDict(
+            (name, HeaderDimension(name, size or numrecs, size == 0)) for name, size in dims
+        )
+        file_map = _FileMap(path)
+        for var_ in variables.values():
+            var_.file_map = file_map
+        return HeaderDataset(path, file_format, numrecs, dimensions, attrs, variables, file_map)
+
+    @staticmethod
+    def record_size(record_vars):
+        record_size = sum(var_.vsize for var_ in record_vars)
+        # A lone record variable's records aren't padded
+        if len(record_vars) == 1:
+            record_size = min(record_size, _product(record_vars[0].shape[1:]) *
+                              struct.calcsize(_nc_types[record_vars[0].nc_type][0]))
+        return record_size
+
+    @classmethod
+    def streaming_numrecs(cls, path, record_vars):
+        # The number of records wasn't written; work it out from the file size
+        if not record_vars:
+            return 0
+        record_size = cls.record_size(record_vars)
+        begin = min(var_.begin for var_ in record_vars)
+        return max(0, (os.path.getsize(path) - begin) // record_size) if record_size else 0
+
+
+def read_header(path):
+    '''Reads the header of NetCDF file `path` without the netCDF library.
+
+    Returns a HeaderDataset, or None if the file is not in one of the
+    classic formats (e.g. it is a netCDF-4/HDF5 file). Only the header,
+    typically a few kilobytes, is read from the file.
+    '''
+    with open(path, 'rb') as file_:
+        magic = file_.read(4)
+        if len(magic) != 4 or magic[:3] != b'CDF' or magic[3] not in _classic_formats:
+            return None
+        version = magic[3]
+        return _HeaderParser(file_, version).parse(path, _classic_formats[version])
+
+
+def _dtype_code(dtype):
+    # e.g. 'f4' for float32, as HeaderVariable has it; str for variable length
+    # strings
+    if hasattr(dtype, 'kind') and hasattr(dtype, 'itemsize'):
+        return '{}{}'.format(dtype.kind, dtype.itemsize)
+    return getattr(dtype, '__name__', str(dtype))
+
+
+def _attrs_record(obj):
+    return collections.OrderedDict((name, obj.getncattr(name)) for name in obj.ncattrs())
+
+
+@only_reads_header
+def header_record(nc):
+    '''Returns the header of open NetCDF file `nc` (its format, global
+    attributes, dimensions, and variables with their attributes and
+    storage layout) as a dict of plain values, from which the header-only
+    checks can be run on it again (see `snapshot_dataset`)'''
+    variables = []
+    for name, var_ in nc.variables.items():
+        try:
+            chunk_cache = var_.get_var_chunk_cache()[0]
+        except Exception:
+            chunk_cache = None
+        variables.append(collections.OrderedDict((
+            ('name', name),
+            ('dimensions', list(var_.dimensions)),
+            ('shape', list(var_.shape)),
+            ('dtype', _dtype_code(var_.dtype)),
+            ('attrs', _attrs_record(var_)),
+            ('chunking', var_chunks(var_)),
+            ('filters', var_.filters()),
+            ('endian', var_.endian()),
+            ('chunk_cache', chunk_cache),
+            ('record_stride', getattr(var_, 'record_stride', None)),
+        )))
+    return collections.OrderedDict((
+        ('format', nc.data_model),
+        ('attrs', _attrs_record(nc)),
+        ('dimensions', [[name, len(dim), dim.isunlimited()] for name, dim in nc.dimensions.items()]),
+        ('variables', variables),
+    ))
+
+
+class SnapshotVariable(HeaderVariable):
+    '''A variable rebuilt from a `header_record`'''
+
+    def __init__(self, record):
+        self.name = record['name']
+        self.dimensions = tuple(record['dimensions'])
+        self.shape = tuple(record['shape'])
+        self.ndim = len(self.shape)
+        self.dtype = record['dtype']
+        self.record_stride = record['record_stride']
+        self._attrs = record['attrs']
+        self._record = record
+        self.file_map = None
+
+    def chunking(self):
+        chunks = self._record['chunking']
+        return 'contiguous' if chunks is None else chunks
+
+    def filters(self):
+        return self._record['filters']
+
+    def endian(self):
+        return self._record['endian']
+
+    def get_var_chunk_cache(self):
+        if self._record['chunk_cache'] is None:
+            raise AttributeError('get_var_chunk_cache')
+        return self._record['chunk_cache'], None, None
+
+
+def snapshot_dataset(path, record):
+    '''Returns a HeaderDataset for file `path` rebuilt from its
+    `header_record`, against which header-only checks can be run'''
+    dimensions = collections.OrderedDict(
+        (name, HeaderDimension(name, size, unlimited))
+        for name, size, unlimited in record['dimensions'])
+    numrecs = next((len(dim) for dim in dimensions.values() if dim.isunlimited()), 0)
+    variables = collections.OrderedDict(
+        (var_record['name'], SnapshotVariable(var_record)) for var_record in record['variables'])
+    return HeaderDataset(path, record['format'], numrecs, dimensions, record['attrs'], variables)
+
+
+def open_dataset(file_, check_names, extracts=()):
+    '''Opens NetCDF file `file_` for running the named checks and extracts
+    (see `lint_file`).
+
+    If all of them only need the file's header, or read data only through
+    the ReadPlanner (see `can_read_mapped`), and the file is in one of the
+    classic formats, only its header is parsed, and any data is read from
+    the file mapped into memory. Otherwise, the file is opened as an
+    nchelpers CFDataset.
+    '''
+    if all(name in header_check_list or name in mapped_check_list
+           for name in itertools.chain(check_names, extracts)):
+        nc = read_header(file_)
+        if nc is not None:
+            return nc
+    import nchelpers
+    return nchelpers.CFDataset(file_, 'r')
+
+
+class CheckResult(object):
+    '''The result of running one check on one file.
+
+    `value` is what the check returned (truthy if the check failed),
+    `elapsed` and `cpu` the wall and CPU time it took in seconds,
+    `bytes_read` the bytes of variable data it read (from the file, or from
+    blocks shared with other checks, see ReadPlanner), `rss_delta` how much
+    it raised the process's peak RSS in bytes, and `error` a message if
+    it could not be run (None otherwise). `cached` is True if the result
+    came from the result cache rather than from running the check.
+    `coverage` is the fraction of the data a data check wanted that it
+    read (less than 1 if it read a sample, under an I/O budget), or None
+    if it read none; the result is `exact` unless it read a sample.
+    '''
+
+    __slots__ = ('check', 'value', 'elapsed', 'cpu', 'bytes_read', 'rss_delta', 'error', 'cached',
+                 'coverage')
+
+    def __init__(self, check, value=None, elapsed=None, error=None, cached=False):
+        self.check = check
+        self.value = value
+        self.elapsed = elapsed
+        self.cpu = self.bytes_read = self.rss_delta = None
+        self.error = error
+        self.cached = cached
+        self.coverage = None
+
+    @property
+    def exact(self):
+        return self.coverage is None or self.coverage >= 1
+
+    @property
+    def failed(self):
+        return self.error is not None or bool(self.value)
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return 'error'
+        return 'fail' if self.value else 'pass'
+
+    def __repr__(self):
+        return 'CheckResult({!r}, {!r}, elapsed={!r}, error={!r}, cached={!r})'.format(
+            self.check, self.value, self.elapsed, self.error, self.cached)
+
+
+class FileResult(object):
+    '''The results of running checks on one file.
+
+    `results` is a list of CheckResults, `bytes_read` the bytes of
+    variable data read from the file, `open_elapsed` and `open_cpu` the
+    wall and CPU time taken to open it, `profile` the path of its
+    cProfile statistics, if it was profiled, and `prefetch_elapsed` and
+    `prefetch_bytes` the time taken and bytes asked for by prefetching it,
+    if it was prefetched, and `extracts` the values of the extracts asked
+    for (see `lint_file`), indexed by name.
+    '''
+
+    __slots__ = ('path', 'results', 'bytes_read', 'open_elapsed', 'open_cpu', 'profile',
+                 'prefetch_elapsed', 'prefetch_bytes', 'extracts')
+
+    def __init__(self, path, results=None):
+        self.path = path
+        self.results = results if results is not None else []
+        self.bytes_read = 0
+        self.open_elapsed = self.open_cpu = None
+        self.profile = None
+        self.prefetch_elapsed = self.prefetch_bytes = None
+        self.extracts = {}
+
+    @property
+    def failed(self):
+        return any(result.failed for result in self.results)
+
+    @property
+    def elapsed(self):
+        return (self.open_elapsed or 0) + sum(result.elapsed or 0 for result in self.results)
+
+    def __repr__(self):
+        return 'FileResult({!r}, {!r})'.format(self.path, self.results)
+
+
+def _peak_rss():
+    '''Returns the peak resident set size of this process in bytes, or 0
+    where that can't be found'''
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes, except on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def is_dataset(file_):
+    '''Returns True if `file_` is an open NetCDF file (e.g. a CFDataset)
+    rather than a path'''
+    return hasattr(file_, 'ncattrs') and hasattr(file_, 'variables')
+
+
+def _error_results(check_names, stop_on_failure, error):
+    '''Returns the CheckResults for checks that could not be run because of
+    `error` (just the first, if `stop_on_failure`)'''
+    if stop_on_failure:
+        check_names = check_names[:1]
+    return [CheckResult(check_name, error=error) for check_name in check_names]
+
+
+def _run_checks(file_result, check_names, stop_on_failure, nc=None, extracts=()):
+    # Files opened here are closed here, so that handles (and the netCDF
+    # library's state for them) don't pile up over a run
+    if nc is not None:
+        _run_checks_on(file_result, check_names, stop_on_failure, nc, extracts)
+        return
+
+    start, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        nc = open_dataset(file_result.path, check_names, extracts)
+    except Exception as e:
+        file_result.results = _error_results(
+            check_names, stop_on_failure, 'Cannot open file: {}'.format(e))
+        return
+    finally:
+        file_result.open_elapsed = time.perf_counter() - start
+        file_result.open_cpu = time.process_time() - start_cpu
+    try:
+        _run_checks_on(file_result, check_names, stop_on_failure, nc, extracts)
+    finally:
+        try:
+            nc.close()
+        except Exception:
+            # The checks have been run; their results stand
+            pass
+
+
+def _run_checks_on(file_result, check_names, stop_on_failure, nc, extracts):
+    start, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        # An open file may have changed since it was last checked
+        _file_state.pop(nc, None)
+        planner = read_planner(nc)
+        if not stop_on_failure:
+            planner.plan(check_names)
+    except Exception as e:
+        file_result.results = _error_results(
+            check_names, stop_on_failure, 'Cannot open file: {}'.format(e))
+        return
+    finally:
+        file_result.open_elapsed = (file_result.open_elapsed or 0) + time.perf_counter() - start
+        file_result.open_cpu = (file_result.open_cpu or 0) + time.process_time() - start_cpu
+
+    for position, check_name in enumerate(check_names):
+        bytes_read, bytes_served, peak_rss = planner.bytes_read, planner.bytes_served, _peak_rss()
+        planner.wanted_bytes = planner.kept_bytes = 0
+        start, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            if not planner.planned and check_name in read_plans:
+                # When stopping on failure, nothing is read for the checks
+                # still to run until the first of them that plans reads
+                # is reached, as an earlier check may yet fail the file
+                planner.plan(check_names[position:])
+            result = CheckResult(check_name, globals()[check_name](nc))
+        except Exception as e:
+            result = CheckResult(check_name, error='{}: {}'.format(type(e).__name__, e))
+        result.elapsed = time.perf_counter() - start
+        result.cpu = time.process_time() - start_cpu
+        result.bytes_read = planner.bytes_served - bytes_served
+        result.rss_delta = _peak_rss() - peak_rss
+        if planner.wanted_bytes:
+            result.coverage = planner.kept_bytes / float(planner.wanted_bytes)
+        # Only bytes fetched from the file took time to read
+        observe_read_rate(planner.bytes_read - bytes_read, result.elapsed)
+        file_result.results.append(result)
+        if result.failed and stop_on_failure:
+            break
+    for name in extracts:
+        try:
+            file_result.extracts[name] = globals()[name](nc)
+        except Exception:
+            pass
+    file_result.bytes_read = planner.bytes_read
+
+
+def lint_file(file_, check_names, stop_on_failure=False, profile_dir=None, extracts=()):
+    '''Opens NetCDF file `file_` and runs the named checks against it.
+
+    Returns a FileResult, holding a CheckResult for each check that was
+    run. A check that raises an exception, or that can't be run because
+    the file can't be opened, gets an error result. If `stop_on_failure`
+    is True, no further checks are run once one has failed. If
+    `check_names` is empty, the file is not opened. If `profile_dir` is
+    given, the work is profiled with cProfile and the statistics saved in
+    a file in that directory. `extracts` names functions (e.g.
+    `file_summary`) to apply to the open file once checked; their values
+    are kept in the FileResult's `extracts`, except for any that raise.
+
+    The file is opened here rather than by the caller so that this
+    function can be run in a worker process without passing any NetCDF
+    handles between processes. `file_` may also be an already open file
+    (e.g. a CFDataset), which is checked as it is and left open.
+    '''
+    nc = None
+    if is_dataset(file_):
+        nc, file_ = file_, file_.filepath()
+    file_result = FileResult(file_)
+    if not check_names and not extracts:
+        return file_result
+    if profile_dir is None:
+        _run_checks(file_result, check_names, stop_on_failure, nc, extracts)
+        return file_result
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.runcall(_run_checks, file_result, check_names, stop_on_failure, nc, extracts)
+    fd, file_result.profile = tempfile.mkstemp(
+        suffix='.pstats', prefix=os.path.basename(file_) + '-', dir=profile_dir)
+    os.close(fd)
+    profiler.dump_stats(file_result.profile)
+    return file_result
+
+
+def _init_worker(settings, detach=False):
+    '''Sets up a worker process with the main process's module `settings`.
+
+    If `detach`, the worker is kept out of the main process's process
+    group, so that signals sent to the whole group (Ctrl-C, a service
+    manager stopping a server) reach only the main process, which then
+    stops the workers. A worker killed while idle holds the pool's task
+    queue lock, and the pool could not then be stopped.
+    '''
+    configure(**settings)
+    if detach and hasattr(os, 'setpgrp'):
+        os.setpgrp()
+
+
+def _lint_task(task):
+    '''Unpacks a (file_, check_names, stop_on_failure, profile_dir, extracts)
+    task for `lint_file`'''
+    return lint_file(*task)
+
+
+def _process_rss(pid):
+    '''Returns the resident set size of process `pid` in bytes, or None
+    where that can't be found (it is read from /proc)'''
+    try:
+        with open('/proc/{}/statm'.format(pid)) as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _worker_main(conn, settings, detach):
+    '''Runs the lint tasks sent over `conn` in a Supervisor's worker process,
+    sending back their results, until told to stop'''
+    _init_worker(settings, detach)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        conn.send(_lint_task(task))
+
+
+class _Worker(object):
+    '''A Supervisor's worker process, and the task it is running'''
+
+    def __init__(self, detach):
+        import multiprocessing
+
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main, args=(child_conn, settings(), detach))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.job = None
+        self.started = None
+
+    def start(self, job):
+        self.job = job
+        self.started = time.monotonic()
+        self.conn.send(job[2])
+
+    def kill(self):
+        if hasattr(self.process, 'kill'):
+            self.process.kill()
+        else:
+            # Process.kill is new in Python 3.7
+            import signal
+            os.kill(self.process.pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        self.process.join(1)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+
+class Supervisor(object):
+    '''Runs lint tasks in worker processes of its own, isolating each file.
+
+    Unlike a multiprocessing pool, a worker that takes longer than
+    `file_timeout` seconds over one file, or whose resident memory grows
+    past `max_rss` bytes (where /proc is available), is killed and
+    replaced, and the file gets an error result: a corrupt file can't
+    hang or exhaust a run, even inside the netCDF library. A worker that
+    dies (e.g. crashes in the library) is replaced in the same way.
+    `detach` keeps the workers out of the process group (see
+    `_init_worker`).
+    '''
+
+    poll_interval = 0.1
+
+    def __init__(self, processes, file_timeout=None, max_rss=None, detach=False):
+        self.file_timeout = file_timeout
+        self.max_rss = max_rss
+        self.detach = detach
+        self.workers = [_Worker(detach) for _ in range(processes)]
+
+    def imap(self, iterable, window, deadline=None):
+        '''Yields (item, FileResult) for each (item, task) pair of `iterable`,
+        in order, running `lint_file` on each task in the workers.
+
+        At most `window` tasks are in flight (or waiting to be yielded) at
+        once, so `iterable` is consumed lazily. If the results aren't all
+        in by `deadline` (a time.monotonic() time), the busy workers are
+        replaced and multiprocessing.TimeoutError is raised.
+        '''
+        iterable = iter(iterable)
+        waiting = collections.deque()
+        done = {}
+        taken = yielded = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and taken - yielded < window:
+                    try:
+                        item, task = next(iterable)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    waiting.append((taken, item, task))
+                    taken += 1
+                for worker in self.workers:
+                    if worker.job is None and waiting:
+                        worker.start(waiting.popleft())
+                if yielded in done:
+                    yield done.pop(yielded)
+                    yielded += 1
+                elif exhausted and yielded == taken:
+                    return
+                else:
+                    self.collect(done, deadline)
+        finally:
+            # Workers still busy (the caller stopped early, or time ran out)
+            # would send results no one will read
+            for index, worker in enumerate(self.workers):
+                if worker.job is not None:
+                    self.replace(index)
+
+    def collect(self, done, deadline):
+        '''Waits for results, and kills workers that have run over their
+        limits, putting the (item, FileResult) of each finished task in
+        `done`, indexed by its position'''
+        import multiprocessing
+        from multiprocessing.connection import wait
+
+        busy = {worker.conn: index for index, worker in enumerate(self.workers)
+                if worker.job is not None}
+        timeout = None
+        if self.file_timeout is not None or self.max_rss is not None:
+            timeout = self.poll_interval
+        if deadline is not None:
+            remaining = max(0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        for conn in wait(list(busy), timeout):
+            index = busy[conn]
+            worker = self.workers[index]
+            try:
+                self.finish(done, worker, conn.recv())
+            except (EOFError, OSError):
+                worker.process.join(1)
+                self.fail(done, index, 'Worker process died (exit code {})'.format(
+                    worker.process.exitcode))
+
+        now = time.monotonic()
+        for index, worker in enumerate(self.workers):
+            if worker.job is None:
+                continue
+            if self.file_timeout is not None and now - worker.started > self.file_timeout:
+                self.fail(done, index, 'Timed out after {} s'.format(self.file_timeout))
+            elif self.max_rss is not None:
+                rss = _process_rss(worker.process.pid)
+                if rss is not None and rss > self.max_rss:
+                    self.fail(done, index, 'Exceeded memory limit ({} bytes resident)'.format(rss))
+        if deadline is not None and time.monotonic() >= deadline:
+            raise multiprocessing.TimeoutError()
+
+    @staticmethod
+    def finish(done, worker, file_result):
+        position, item, _ = worker.job
+        done[position] = (item, file_result)
+        worker.job = None
+
+    def fail(self, done, index, error):
+        # The file's checks are reported as errors, and the worker replaced
+        position, item, task = self.workers[index].job
+        file_, check_names, stop_on_failure = task[:3]
+        file_result = FileResult(file_, _error_results(check_names, stop_on_failure, error))
+        done[position] = (item, file_result)
+        self.replace(index)
+
+    def replace(self, index):
+        self.workers[index].kill()
+        self.workers[index] = _Worker(self.detach)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+def _matches(name, patterns):
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def walk_files(top, include=('*.nc',), exclude=()):
+    '''Yields the files under directory `top`, at any depth, whose names match
+    one of the `include` patterns and none of the `exclude` patterns.
+
+    Directories whose names match an `exclude` pattern are not entered.
+    Symbolic links to directories are followed, but no directory is
+    entered twice, so links back up the tree can't loop. Entries that
+    can't be read are reported and skipped.
+
+    Each directory is scanned with os.scandir, keeping only the names (as
+    strings) of the files and subdirectories that match; these are sorted
+    so that the walk is the same every time, and the directory's files
+    are yielded as soon as it has been scanned. Memory use is that of the
+    matching names of one directory (plus the subdirectories still to be
+    walked), not of all its entries.
+    '''
+    visited = set()
+    directories = [top]
+    while directories:
+        directory = directories.pop()
+        files, subdirectories = [], []
+        try:
+            info = os.stat(directory)
+            if (info.st_dev, info.st_ino) in visited:
+                continue
+            visited.add((info.st_dev, info.st_ino))
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if _matches(entry.name, exclude):
+                        continue
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError as e:
+                        print('Cannot read: {}'.format(e), file=sys.stderr)
+                        continue
+                    if is_dir:
+                        subdirectories.append(entry.name)
+                    elif _matches(entry.name, include):
+                        files.append(entry.name)
+        except OSError as e:
+            print('Cannot read directory: {}'.format(e), file=sys.stderr)
+            continue
+        for name in sorted(files):
+            yield os.path.join(directory, name)
+        directories.extend(os.path.join(directory, name)
+                           for name in sorted(subdirectories, reverse=True))
+
+
+def read_paths(stream, separator=b'\n'):
+    '''Yields the paths listed in binary `stream`, separated by `separator`
+    (e.g. newline or NUL). The stream is read in blocks, so paths are
+    yielded as they arrive.'''
+    def split():
+        pending = b''
+        for block in iter(lambda: stream.read(65536), b''):
+            paths = (pending + block).split(separator)
+            pending = paths.pop()
+            for path in paths:
+                yield path
+        yield pending
+
+    for path in split():
+        if separator == b'\n':
+            path = path.rstrip(b'\r')
+        if path:
+            yield os.fsdecode(path)
+
+
+def read_path_file(path, separator=b'\n'):
+    '''Yields the paths listed in file `path` (see `read_paths`), closing it
+    once they have all been read'''
+    with open(path, 'rb') as stream:
+        for listed in read_paths(stream, separator):
+            yield listed
+
+
+def iter_files(paths, include=('*.nc',), exclude=()):
+    '''Yields the files to check for `paths`: each path that names a directory
+    is walked (see `walk_files`); any other path is yielded as is'''
+    for path in paths:
+        if os.path.isdir(path):
+            for file_ in walk_files(path, include, exclude):
+                yield file_
+        else:
+            yield path
+
+
+# Ways of assigning files to shards (see `shard_files`)
+shard_methods = ('size', 'hash')
+
+def parse_shard(text):
+    '''Parses a shard given as `i/N`, shard i (from 0) of N, into (i, N)'''
+    index, _, count = text.partition('/')
+    index, count = int(index), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError('Shard must be i/N with 0 <= i < N')
+    return index, count
+
+
+def _path_shard(path, count):
+    digest = hashlib.sha1(os.path.normpath(path).encode('utf-8', 'surrogateescape')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def shard_files(files, index, count, method='size', size=None):
+    '''Yields the `files` that fall in shard `index` of `count`, in order.
+
+    Every shard given the same files gets the same assignment, so shards
+    can be run independently (e.g. on different nodes). With the `size`
+    method, files are dealt out largest first, each to the shard with the
+    least data so far (ties going to the lowest shard, and equal sizes in
+    path order), so shards get about the same amount of data; all the
+    files are listed and stat'ed first. With the `hash` method, a file's
+    shard is a hash of its path, so files are yielded as they are found
+    but shards are balanced only by count. `size` returns a file's size for
+    the `size` method (by default, its size on disk).
+    '''
+    if method == 'hash':
+        for file_ in files:
+            if _path_shard(file_, count) == index:
+                yield file_
+        return
+
+    def stat_size(file_):
+        try:
+            return os.stat(file_).st_size
+        except OSError:
+            return 0
+
+    size = size or stat_size
+    files = list(files)
+    loads = [(0, shard) for shard in range(count)]
+    mine = set()
+    for file_size, file_ in sorted(((size(file_), file_) for file_ in files),
+                                   key=lambda item: (-item[0], item[1])):
+        load, shard = heapq.heappop(loads)
+        if shard == index:
+            mine.add(file_)
+        heapq.heappush(loads, (load + file_size, shard))
+    for file_ in files:
+        if file_ in mine:
+            yield file_
+
+
+def _stable_repr(value):
+    '''Returns a repr of `value` that does not vary between interpreter runs,
+    or None if `value` is not plain data'''
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        items = [_stable_repr(item) for item in value]
+        if None in items:
+            return None
+        return '{}({})'.format(type(value).__name__, ','.join(items))
+    if isinstance(value, (set, frozenset)):
+        items = [_stable_repr(item) for item in value]
+        if None in items:
+            return None
+        return '{}({})'.format(type(value).__name__, ','.join(sorted(items)))
+    if isinstance(value, dict):
+        items = [(_stable_repr(k), _stable_repr(v)) for k, v in value.items()]
+        if any(None in item for item in items):
+            return None
+        return 'dict({})'.format(','.join(sorted('{}:{}'.format(*item) for item in items)))
+    return None
+
+
+def _hash_code(code, digest, seen):
+    digest.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(const, digest, seen)
+        else:
+            digest.update(repr(const).encode('utf-8'))
+    for name in code.co_names:
+        _hash_global(name, digest, seen)
+
+
+# Module globals that hold per-process state (memos and measurements) or
+# settings, which a check's (cacheable) result doesn't depend on: they are
+# left out of check fingerprints, which would otherwise change as checks run
+unhashed_globals = frozenset(('_file_state', '_attr_profiles', '_read_rate') + settings_names)
+
+
+def _hash_global(name, digest, seen):
+    if name in seen or name in unhashed_globals or name not in globals():
+        return
+    seen.add(name)
+    value = globals()[name]
+    if isinstance(value, types.FunctionType):
+        if value.__module__ == __name__:
+            digest.update(name.encode('utf-8'))
+            _hash_code(value.__code__, digest, seen)
+    elif isinstance(value, type):
+        if value.__module__ == __name__:
+            digest.update(name.encode('utf-8'))
+            for attr in sorted(vars(value)):
+                member = vars(value)[attr]
+                if isinstance(member, types.FunctionType):
+                    _hash_code(member.__code__, digest, seen)
+    else:
+        value_repr = _stable_repr(value)
+        if value_repr is not None:
+            digest.update('{}={}'.format(name, value_repr).encode('utf-8'))
+
+
+def check_fingerprint(check):
+    '''Returns a digest identifying the current version of function `check`.
+
+    The digest covers the check's own code plus the code of every function
+    in this module that it refers to, and the values of the module-level
+    data (e.g. attribute lists) that those functions refer to, so it
+    changes whenever anything that could change the check's result does.
+    '''
+    digest = hashlib.sha1(check.__name__.encode('utf-8'))
+    _hash_code(check.__code__, digest, {check.__name__})
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    '''An on-disk (SQLite) cache of check results.
+
+    Entries are keyed on a file's absolute path, size, mtime and inode, and
+    on the fingerprint of the check that produced them, so a cached result
+    is only used while both the file and the check are unchanged.
+    '''
+
+    commit_interval = 100
+
+    def __init__(self, path):
+        import sqlite3
+        # The lint server uses the cache from its request threads, one at a time
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                path TEXT NOT NULL,
+                check_name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                result BLOB NOT NULL,
+                PRIMARY KEY (path, check_name)
+            )
+        ''')
+        self.fingerprints = {name: check_fingerprint(globals()[name]) for name in check_list}
+        # File summaries, for checks across files, are cached like results
+        self.fingerprints[summary_cache_name] = check_fingerprint(file_summary)
+        self.pending = 0
+
+    @staticmethod
+    def file_key(file_):
+        '''Returns the (path, size, mtime_ns, inode) key for `file_`, or None if
+        it can't be stat'ed'''
+        try:
+            st = os.stat(file_)
+        except OSError:
+            return None
+        return os.path.abspath(file_), st.st_size, st.st_mtime_ns, st.st_ino
+
+    def lookup(self, key):
+        '''Returns a dict of the valid cached results for the file with `key`,
+        indexed by check name'''
+        if key is None:
+            return {}
+        rows = self.db.execute(
+            'SELECT check_name, size, mtime_ns, inode, fingerprint, result '
+            'FROM results WHERE path = ?', key[:1]
+        )
+        return {
+            check_name: pickle.loads(result)
+            for check_name, size, mtime_ns, inode, fingerprint, result in rows
+            if (size, mtime_ns, inode) == key[1:] and
+               fingerprint == self.fingerprints.get(check_name)
+        }
+
+    def store(self, key, results):
+        '''Records CheckResults `results` for the file with `key`. Errors, and
+        results from a sample of the data, are not cached.'''
+        if key is None:
+            return
+        self.db.executemany(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [key[:1] + (result.check,) + key[1:] +
+             (self.fingerprints[result.check], pickle.dumps(result.value, protocol=2))
+             for result in results
+             if result.error is None and not result.cached and result.exact]
+        )
+        self.pending += 1
+        if self.pending >= self.commit_interval:
+            self.db.commit()
+            self.pending = 0
+
+    def prune(self):
+        '''Removes entries for files that have changed or disappeared, and for
+        checks that have changed or no longer exist. Returns the number
+        of entries removed.'''
+        stale = []
+        rows = self.db.execute(
+            'SELECT path, check_name, size, mtime_ns, inode, fingerprint FROM results'
+        )
+        for path, check_name, size, mtime_ns, inode, fingerprint in rows.fetchall():
+            if (self.file_key(path) != (path, size, mtime_ns, inode) or
+                    fingerprint != self.fingerprints.get(check_name)):
+                stale.append((path, check_name))
+        self.db.executemany('DELETE FROM results WHERE path = ? AND check_name = ?', stale)
+        self.db.commit()
+        return len(stale)
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class Snapshot(object):
+    '''A snapshot of the headers of NetCDF files (see `header_record`), in
+    an SQLite database at `path`.
+
+    Header-only checks can be run on the snapshot (see `datasets`) instead
+    of on the files themselves, e.g. to try a new attribute rule on a
+    whole archive. Headers are written in bulk, `commit_interval` at a
+    time, as JSON.
+    '''
+
+    commit_interval = 1000
+
+    def __init__(self, path):
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS headers (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                header TEXT NOT NULL
+            )
+        ''')
+        self.pending = []
+
+    def add(self, key, record):
+        '''Records `header_record` `record` for the file with (path, size,
+        mtime_ns, inode) `key` (see ResultCache.file_key)'''
+        self.pending.append(key + (json.dumps(record, default=_json_default, separators=(',', ':')),))
+        if len(self.pending) >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?)', self.pending)
+        self.pending = []
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM headers').fetchone()[0]
+
+    def datasets(self, paths=(), shard=None):
+        '''Yields a HeaderDataset (see `snapshot_dataset`) for each file in
+        the snapshot, in path order; if `paths` are given, only for the
+        files that are or are in one of them. If `shard` is an (index,
+        count, method) tuple, only for the files in that shard (see
+        `shard_files`), sized as they were when the snapshot was taken.
+        '''
+        prefixes = [os.path.abspath(path) for path in paths]
+
+        def wanted(path):
+            return not prefixes or any(path == prefix or path.startswith(prefix.rstrip(os.sep) + os.sep)
+                                       for prefix in prefixes)
+
+        if shard:
+            sizes = collections.OrderedDict(
+                (path, size or 0) for path, size in self.db.execute('SELECT path, size FROM headers ORDER BY path')
+                if wanted(path)
+            )
+            for path in shard_files(sizes, *shard, size=sizes.get):
+                header, = self.db.execute('SELECT header FROM headers WHERE path = ?', (path,)).fetchone()
+                yield snapshot_dataset(path, json.loads(header))
+            return
+        for path, header in self.db.execute('SELECT path, header FROM headers ORDER BY path'):
+            if wanted(path):
+                yield snapshot_dataset(path, json.loads(header))
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+# Bytes at the start of a netCDF-4 (HDF5) file to prefetch for its header
+prefetch_header_bytes = 2 ** 20
+# Ranges of a file closer than this are prefetched as one
+prefetch_gap_bytes = 2 ** 16
+
+
+def prefetch_ranges(path, check_names):
+    '''Returns the (offset, length) ranges of file `path` that the named
+    checks will read.
+
+    For a classic format file these are the blocks of variable data the
+    checks plan to read (see `plans_reads`); its header has been read
+    already. Where a netCDF-4 file's data lies can't be told without the
+    netCDF library, so only its start, where its metadata usually is, is
+    given: prefetching all of a large file would waste far more I/O than
+    it could save.
+    '''
+    nc = read_header(path)
+    if nc is None:
+        return [(0, min(os.path.getsize(path), prefetch_header_bytes))]
+
+    plans = [read_plans[check_name](nc) for check_name in check_names if check_name in read_plans]
+    # Under an I/O budget, only the blocks the checks will sample
+    fraction = sample_fraction(nc, set(itertools.chain.from_iterable(plans)))
+    ranges = []
+    for plan in plans:
+        by_variable = collections.OrderedDict()
+        for varname, bounds in plan:
+            by_variable.setdefault(varname, []).append(bounds)
+        for varname, tiles in by_variable.items():
+            for bounds in sample_tiles(nc.variables[varname], path, varname, tiles, fraction):
+                ranges.extend(nc.variables[varname].byte_ranges(bounds))
+    merged = []
+    for offset, length in sorted(ranges):
+        if merged and offset <= sum(merged[-1]) + prefetch_gap_bytes:
+            merged[-1] = (merged[-1][0], max(sum(merged[-1]), offset + length) - merged[-1][0])
+        else:
+            merged.append((offset, length))
+    return merged
+
+
+class Prefetcher(object):
+    '''Warms the page cache for files before they are checked.
+
+    `ahead` runs `distance` files ahead of the checker, in a pool of as many
+    threads, opening each file (which fetches its metadata) and asking the
+    OS to read ahead the ranges the checks will read (see
+    `prefetch_ranges`) with posix_fadvise, or reading them itself where
+    that isn't available. Waiting for I/O then overlaps with checking.
+    Prefetching is best effort: errors are ignored, and left to checking
+    to report.
+    '''
+
+    def __init__(self, distance):
+        import queue
+        self.distance = distance
+        self.queue = queue.Queue()
+        # Daemon threads (not a ThreadPoolExecutor's, which are joined at
+        # exit), so that a prefetch stuck in the OS, e.g. opening a FIFO or a
+        # file on a hung mount, can't keep the process from exiting
+        for _ in range(distance):
+            threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        '''Prefetches the files queued, until given None'''
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            future, path, check_names = item
+            if future.set_running_or_notify_cancel():
+                future.set_result(self.warm(path, check_names))
+
+    @staticmethod
+    def warm(path, check_names):
+        '''Prefetches file `path` for the named checks. Returns the time
+        taken and the number of bytes prefetched.'''
+        start = time.perf_counter()
+        prefetched = 0
+        try:
+            ranges = prefetch_ranges(path, check_names)
+            with open(path, 'rb') as file_:
+                for offset, length in ranges:
+                    if hasattr(os, 'posix_fadvise'):
+                        os.posix_fadvise(file_.fileno(), offset, length, os.POSIX_FADV_WILLNEED)
+                    else:
+                        file_.seek(offset)
+                        remaining = length
+                        while remaining > 0 and file_.read(min(remaining, 2 ** 20)):
+                            remaining -= 2 ** 20
+                    prefetched += length
+        except Exception:
+            pass
+        return time.perf_counter() - start, prefetched
+
+    def ahead(self, work):
+        '''Yields the ((key, cached, prefetch), task) items of `work` (see
+        `_lint`), `distance` items after starting to prefetch each one'''
+        import concurrent.futures
+
+        pending = collections.deque()
+        for (key, cached, _), task in work:
+            file_, check_names = task[:2]
+            future = None
+            if check_names:
+                future = concurrent.futures.Future()
+                self.queue.put((future, file_, check_names))
+            pending.append(((key, cached, future), task))
+            if len(pending) > self.distance:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    def close(self):
+        for _ in range(self.distance):
+            self.queue.put(None)
+
+
+# Relative costs of running a check that only reads the header, one that
+# needs the netCDF library (but reads no variable data), and one that reads
+# data, used to order checks until they have been timed
+check_class_costs = {'header': 1, 'metadata': 10, 'data': 100}
+# Seconds that a check class cost of 1 stands for
+check_cost_seconds = 1e-4
+
+
+class CheckScheduler(object):
+    '''Orders the checks to run on a file so that, when checking stops at
+    the first failure, a failing file takes as little time as possible.
+
+    Checks are run in order of their expected cost over their chance of
+    failing a file. A check's cost is the mean time it has taken in the
+    run so far, or until it has been timed, that of its class (see
+    `check_class_costs`). Its chance of failing is its failure rate so
+    far, starting from 1/2. Ties keep the given order.
+    '''
+
+    def __init__(self):
+        self.elapsed = collections.defaultdict(float)
+        self.timed = collections.Counter()
+        self.runs = collections.Counter()
+        self.failures = collections.Counter()
+
+    @staticmethod
+    def check_class(check_name):
+        if check_name in header_check_list:
+            return 'header'
+        if check_name in data_check_list:
+            return 'data'
+        return 'metadata'
+
+    def cost(self, check_name):
+        '''Returns the expected time, in seconds, of running the named check'''
+        if self.timed[check_name]:
+            return self.elapsed[check_name] / self.timed[check_name]
+        return check_class_costs[self.check_class(check_name)] * check_cost_seconds
+
+    def rank(self, check_name):
+        failure_rate = (self.failures[check_name] + 1.) / (self.runs[check_name] + 2.)
+        return self.cost(check_name) / failure_rate
+
+    def order(self, check_names):
+        '''Returns `check_names` in the order in which to run them'''
+        return sorted(check_names, key=self.rank)
+
+    def observe(self, results):
+        '''Learns from CheckResults `results` of a file'''
+        for result in results:
+            if result.cached or result.error is not None:
+                continue
+            self.runs[result.check] += 1
+            if result.failed:
+                self.failures[result.check] += 1
+            if result.elapsed is not None:
+                self.elapsed[result.check] += result.elapsed
+                self.timed[result.check] += 1
+
+
+def lint(paths, checks=('layer_one_missing',), jobs=1, stop_on_failure=False,
+         include=('*.nc',), exclude=(), cache=None, profile_dir=None, prefetch=0,
+         file_timeout=None, max_rss=None, supervisor=None, timeout=None, index=None,
+         snapshot=None, shard=None):
+    '''Runs the named checks on NetCDF files, yielding a FileResult for each.
+
+    `paths` is a path or an open file, or an iterable of them (consumed
+    lazily). Directories are searched for files matching `include` and not
+    `exclude` (see `walk_files`). Open files (e.g. a CFDataset a pipeline
+    has just written) are checked as they are, in this process, and left
+    open. `checks` is a list of check names, run in that order.
+
+    Files are checked in `jobs` worker processes (0 means one per CPU), but
+    results are yielded in the order of `paths`. If `cache` (a ResultCache)
+    is given, checks already run on unchanged files are not run again;
+    their results are marked `cached`. See `lint_file` for
+    `stop_on_failure` and `profile_dir`.
+
+    If `prefetch` is positive, files are prefetched that many ahead of
+    being checked (see Prefetcher), and each FileResult records the time
+    and bytes its prefetch took.
+
+    If `file_timeout` (seconds) or `max_rss` (bytes) is given, each file
+    is checked in a worker process (even if `jobs` is 1) that is killed
+    if it takes longer, or grows larger, than that; the file's checks get
+    error results (see Supervisor). Files opened here are always closed
+    once checked.
+
+    A `supervisor` may be given to check files in, instead of starting
+    (and stopping) one; it sets the limits, and `jobs` is then only used
+    to size the window of files in flight. With a supervisor, if all the
+    results aren't in within `timeout` seconds, the files in progress are
+    abandoned and multiprocessing.TimeoutError is raised.
+
+    Checks across files (see `checks_across_files`) are not run here. If
+    an `index` (a MetadataIndex) is given, each file's summary is added to
+    it, from the cache if it holds one, and those checks can be run on
+    the index once all the results are in. If a `snapshot` (a Snapshot) is
+    given, each file's header is added to it (see `header_record`).
+
+    If `shard` is given, as (i, N) or (i, N, method), only the files in
+    shard i of N (see `shard_files`) are checked; open files are always
+    checked.
+
+    If `stop_on_failure`, each file's checks are run cheapest first (see
+    CheckScheduler), which fails the same files as running them in order;
+    the results are still given in the order of `checks`.
+
+    Raises ValueError for an unknown check.
+    '''
+    if isinstance(paths, (str, bytes)) or is_dataset(paths):
+        paths = [paths]
+    check_names = list(checks)
+    for check_name in check_names:
+        if check_name not in check_list:
+            raise ValueError("NetCDF check '{}' does not exist".format(check_name))
+    check_names = [name for name in check_names if name not in aggregate_check_list]
+    if jobs < 0:
+        raise ValueError('jobs must not be negative')
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    if prefetch < 0:
+        raise ValueError('prefetch must not be negative')
+    if shard is not None:
+        shard = tuple(shard)
+        if not 0 <= shard[0] < shard[1] or shard[2:] and shard[2] not in shard_methods:
+            raise ValueError('Invalid shard {}'.format(shard))
+    return _lint(paths, check_names, jobs or os.cpu_count() or 1, stop_on_failure, include,
+                 exclude, cache, profile_dir, prefetch, file_timeout, max_rss, supervisor, deadline,
+                 index, snapshot, shard)
+
+
+def _lint(paths, check_names, jobs, stop_on_failure, include, exclude, cache, profile_dir,
+          prefetch, file_timeout, max_rss, supervisor, deadline, index, snapshot, shard):
+    def work(files):
+        # Answer what we can from the cache; only the remaining checks are run
+        for file_ in files:
+            key = ResultCache.file_key(file_) if cache or snapshot is not None else None
+            cached = cache.lookup(key) if cache else {}
+            if stop_on_failure and any(cached.get(name) for name in check_names):
+                to_run = []
+            else:
+                to_run = [name for name in check_names if name not in cached]
+            if scheduler is not None:
+                to_run = scheduler.order(to_run)
+            extracts = open_extracts
+            if summary_cache_name in cached:
+                extracts = tuple(name for name in extracts if name != 'file_summary')
+            yield (key, cached, None), (file_, to_run, stop_on_failure, profile_dir, extracts)
+
+    scheduler = CheckScheduler() if stop_on_failure else None
+    open_extracts = ()
+    if index is not None:
+        open_extracts += ('file_summary',)
+    if snapshot is not None:
+        open_extracts += ('header_record',)
+
+    own_supervisor = supervisor is None and (
+        jobs > 1 or file_timeout is not None or max_rss is not None)
+    if own_supervisor:
+        supervisor = Supervisor(jobs, file_timeout, max_rss)
+    prefetcher = None
+    if prefetch:
+        prefetcher = Prefetcher(prefetch)
+    try:
+        for is_open, group in itertools.groupby(paths, is_dataset):
+            if is_open:
+                results = (((None, {}, None), lint_file(
+                               nc, scheduler.order(check_names) if scheduler else check_names,
+                               stop_on_failure, profile_dir, open_extracts))
+                           for nc in group)
+            else:
+                files = iter_files(group, include, exclude)
+                if shard is not None:
+                    files = shard_files(files, *shard)
+                tasks = work(files)
+                if prefetcher:
+                    tasks = prefetcher.ahead(tasks)
+                if supervisor is not None:
+                    results = supervisor.imap(tasks, window=4 * jobs, deadline=deadline)
+                else:
+                    results = ((item, _lint_task(task)) for item, task in tasks)
+
+            for (key, cached, prefetched), file_result in results:
+                if prefetched is not None and prefetched.done():
+                    file_result.prefetch_elapsed, file_result.prefetch_bytes = prefetched.result()
+                if scheduler is not None:
+                    scheduler.observe(file_result.results)
+                new_summary = file_result.extracts.get('file_summary')
+                summary = cached.pop(summary_cache_name, new_summary)
+                if cache and (file_result.results or new_summary is not None):
+                    stored = file_result.results
+                    if new_summary is not None:
+                        stored = stored + [CheckResult(summary_cache_name, new_summary)]
+                    cache.store(key, stored)
+                if summary is not None:
+                    file_result.extracts['file_summary'] = summary
+                if index is not None:
+                    index.add(file_result.path, summary)
+                if snapshot is not None and 'header_record' in file_result.extracts:
+                    snapshot.add(key or (os.path.abspath(file_result.path), None, None, None),
+                                 file_result.extracts['header_record'])
+                by_name = {name: CheckResult(name, value, cached=True) for name, value in cached.items()}
+                by_name.update((result.check, result) for result in file_result.results)
+                file_result.results = [by_name[name] for name in check_names if name in by_name]
+                yield file_result
+    finally:
+        if own_supervisor:
+            supervisor.close()
+        if prefetcher is not None:
+            prefetcher.close()
+
+
+def _json_default(value):
+    # numpy scalars and arrays, and anything else json doesn't know
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def _sample_note(result):
+    if result.exact:
+        return ''
+    return ' (sampled {:.1%} of the data)'.format(result.coverage)
+
+
+class TextReport(object):
+    '''Reports failed files (or, if `verbose`, failed checks) as lines of text.
+
+    A file failing checks across files (see MetadataIndex) is reported
+    again once all the files are in, so when not verbose, the files
+    already listed are remembered (if any such checks are run) so that
+    each is listed once.
+    '''
+
+    def __init__(self, stream, check_names, verbose=False):
+        self.stream = stream
+        self.verbose = verbose
+        self.listed = None
+        if not verbose and any(name in aggregate_check_list for name in check_names):
+            self.listed = set()
+
+    def write(self, file_, results):
+        failures = [result for result in results if result.failed]
+        if not failures:
+            return
+        if self.verbose:
+            for result in failures:
+                if result.error is not None:
+                    print('{} ERROR {}: {}'.format(file_, result.check, result.error), file=self.stream)
+                else:
+                    print('{} FAILED {}: {}{}'.format(file_, result.check, result.value,
+                                                      _sample_note(result)), file=self.stream)
+        elif self.listed is None:
+            print(file_, file=self.stream)
+        elif file_ not in self.listed:
+            self.listed.add(file_)
+            print(file_, file=self.stream)
+
+    def close(self):
+        self.stream.flush()
+
+
+result_fields = ('check', 'status', 'result', 'elapsed', 'cpu', 'bytes_read', 'cached', 'error',
+                 'exact', 'coverage')
+
+def result_record(result):
+    '''Returns CheckResult `result` as an OrderedDict of `result_fields`'''
+    return collections.OrderedDict(zip(result_fields, (
+        result.check, result.status, result.value, result.elapsed,
+        result.cpu, result.bytes_read, result.cached, result.error,
+        result.exact, result.coverage
+    )))
+
+
+class JSONLinesReport(object):
+    '''Reports every check result as a JSON object on a line of its own'''
+
+    fields = ('file',) + result_fields
+
+    def __init__(self, stream, check_names, verbose=False):
+        self.stream = stream
+
+    def record(self, file_, result):
+        record = collections.OrderedDict(file=file_)
+        record.update(result_record(result))
+        return record
+
+    def write(self, file_, results):
+        for result in results:
+            self.stream.write(json.dumps(self.record(file_, result), default=_json_default) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+
+class CSVReport(JSONLinesReport):
+    '''Reports every check result as a CSV row; results are JSON-encoded, and
+    booleans spelt as in JSON (true and false)'''
+
+    def __init__(self, stream, check_names, verbose=False):
+        self.stream = stream
+        self.writer = csv.writer(stream)
+        self.writer.writerow(self.fields)
+
+    def write(self, file_, results):
+        for result in results:
+            record = self.record(file_, result)
+            record['result'] = json.dumps(record['result'], default=_json_default)
+            self.writer.writerow([json.dumps(value) if isinstance(value, bool) else value
+                                  for value in record.values()])
+        self.stream.flush()
+
+
+class RunProfile(object):
+    '''Aggregates the timings of a run for --profile.
+
+    Shows a progress line (files/s and MB/s of variable data read) on
+    `stream` while the run goes, and at the end a table of per-check (and
+    file open) wall time percentiles. If `slowest` is given, keeps only
+    the cProfile statistics of that many of the slowest files.
+    '''
+
+    interval = 1.0
+
+    def __init__(self, stream, slowest=0):
+        self.stream = stream
+        self.slowest = slowest
+        self.profiles = []
+        self.stages = collections.OrderedDict()
+        self.files = 0
+        self.bytes_read = 0
+        self.start = self.last_progress = time.perf_counter()
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = {'elapsed': array.array('d'), 'cpu': 0.0, 'bytes_read': 0, 'rss_delta': 0}
+        return self.stages[name]
+
+    def add(self, file_result):
+        self.files += 1
+        self.bytes_read += file_result.bytes_read
+        if file_result.prefetch_elapsed is not None:
+            # In the prefetch threads, so not part of the file's time
+            stage = self.stage('(prefetch)')
+            stage['elapsed'].append(file_result.prefetch_elapsed)
+            stage['bytes_read'] += file_result.prefetch_bytes
+        if file_result.open_elapsed is not None:
+            stage = self.stage('(open)')
+            stage['elapsed'].append(file_result.open_elapsed)
+            stage['cpu'] += file_result.open_cpu
+        for result in file_result.results:
+            if result.elapsed is None:
+                continue
+            stage = self.stage(result.check)
+            stage['elapsed'].append(result.elapsed)
+            stage['cpu'] += result.cpu or 0
+            stage['bytes_read'] += result.bytes_read or 0
+            stage['rss_delta'] = max(stage['rss_delta'], result.rss_delta or 0)
+        if file_result.profile:
+            heapq.heappush(self.profiles, (file_result.elapsed, file_result.path, file_result.profile))
+            if len(self.profiles) > self.slowest:
+                os.remove(heapq.heappop(self.profiles)[2])
+        now = time.perf_counter()
+        if now - self.last_progress >= self.interval:
+            self.last_progress = now
+            self.progress(now)
+
+    def progress(self, now, end='\r'):
+        elapsed = max(now - self.start, 1e-9)
+        self.stream.write('{} files, {:.1f} files/s, {:.1f} MB/s{}'.format(
+            self.files, self.files / elapsed, self.bytes_read / elapsed / 2 ** 20, end))
+        self.stream.flush()
+
+    @staticmethod
+    def percentile(values, fraction):
+        # Nearest-rank percentile of sorted `values`
+        return values[max(0, int(math.ceil(fraction * len(values))) - 1)]
+
+    def summary(self):
+        self.progress(time.perf_counter(), end='\n')
+        row = '{:<48} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>12}\n'
+        self.stream.write(row.format('check', 'count', 'p50 (s)', 'p95 (s)', 'max (s)',
+                                     'cpu (s)', 'MB read', 'max RSS +MB'))
+        for name, stage in self.stages.items():
+            values = sorted(stage['elapsed'])
+            if not values:
+                continue
+            self.stream.write(row.format(
+                name, len(values),
+                '{:.4f}'.format(self.percentile(values, 0.5)),
+                '{:.4f}'.format(self.percentile(values, 0.95)),
+                '{:.4f}'.format(values[-1]),
+                '{:.2f}'.format(stage['cpu']),
+                '{:.1f}'.format(stage['bytes_read'] / 2 ** 20),
+                '{:.1f}'.format(stage['rss_delta'] / 2 ** 20),
+            ))
+        for elapsed, path, profile in sorted(self.profiles, reverse=True):
+            self.stream.write('{:.4f}s {} profile: {}\n'.format(elapsed, path, profile))
+
+
+report_formats = {
+    'text': TextReport,
+    'jsonl': JSONLinesReport,
+    'csv': CSVReport,
+}
+
+
+# Version of the partial result file format
+partial_format = 1
+
+class PartialResults(object):
+    '''Writes the results of one shard of a run to `stream`, for `merge`.
+
+    The partial result file is JSON lines: a header describing the run
+    (`run`: its checks, inputs and the like, the same for every shard;
+    and this shard), then a record per file with its results (see
+    `result_record`) and, for checks across files, its `file_summary`,
+    then a trailer giving the number of files and the exit status, which
+    marks the shard as complete.
+    '''
+
+    def __init__(self, stream, run, shard):
+        import platform
+
+        self.stream = stream
+        self.files = 0
+        self.write_record(collections.OrderedDict((
+            ('nclint_partial', partial_format),
+            ('run', run),
+            ('shard', list(shard)),
+            ('host', platform.node()),
+            ('started', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        )))
+
+    def write_record(self, record):
+        self.stream.write(json.dumps(record, default=_json_default) + '\n')
+
+    def write(self, file_result):
+        record = collections.OrderedDict((
+            ('file', file_result.path),
+            ('results', [result_record(result) for result in file_result.results]),
+        ))
+        if 'file_summary' in file_result.extracts:
+            record['summary'] = file_result.extracts['file_summary']
+        self.write_record(record)
+        self.files += 1
+
+    def close(self, exit_status):
+        self.write_record(collections.OrderedDict((
+            ('complete', True),
+            ('files', self.files),
+            ('exit_status', exit_status),
+            ('finished', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        )))
+        self.stream.close()
+
+
+def _last_line(file_):
+    # The last line of binary file `file_`, read backwards from its end
+    file_.seek(0, os.SEEK_END)
+    end = position = file_.tell()
+    data = b''
+    while position > 0 and data.count(b'\n') < 2:
+        step = min(position, 65536)
+        position -= step
+        file_.seek(position)
+        data = file_.read(step) + data
+    return data.rstrip(b'\n').rsplit(b'\n', 1)[-1] if end else b''
+
+
+def read_partial_header(path):
+    '''Returns the header and the trailer (None if the shard is incomplete)
+    of partial result file `path` (see PartialResults), without reading the
+    records in between. Raises ValueError if it is not a partial result
+    file.'''
+    with open(path, 'rb') as file_:
+        try:
+            header = json.loads(file_.readline().decode('utf-8'))
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get('nclint_partial') != partial_format:
+            raise ValueError('{} is not an nclint partial result file (version {})'.format(
+                path, partial_format))
+        try:
+            trailer = json.loads(_last_line(file_).decode('utf-8'))
+        except ValueError:
+            trailer = None
+    if not isinstance(trailer, dict) or not trailer.get('complete'):
+        trailer = None
+    return header, trailer
+
+
+def read_partial_records(path):
+    '''Yields a FileResult for each file record of partial result file
+    `path`; a file's summary, if recorded, is in its `extracts`'''
+    with open(path) as file_:
+        next(file_)
+        for line in file_:
+            record = json.loads(line)
+            if 'file' not in record:
+                continue
+            results = []
+            for fields in record['results']:
+                result = CheckResult(fields['check'], fields['result'], fields['elapsed'],
+                                     fields['error'], fields['cached'])
+                result.cpu, result.bytes_read = fields['cpu'], fields['bytes_read']
+                result.coverage = fields.get('coverage')
+                results.append(result)
+            file_result = FileResult(record['file'], results)
+            if record.get('summary') is not None:
+                file_result.extracts['file_summary'] = record['summary']
+            yield file_result
+
+
+def merge(paths, report):
+    '''Merges partial result files `paths` (one from each shard of a run)
+    into `report`, running any checks across files on all of their files
+    together; returns the exit status of the whole run.
+
+    Raises ValueError, before reporting anything, if the files are not of
+    the same run, if a shard is missing or given twice, or if a shard is
+    incomplete.
+    '''
+    shards = {}
+    run = count = None
+    for path in paths:
+        header, trailer = read_partial_header(path)
+        index, shard_count = header['shard'][:2]
+        if run is None:
+            run, count = header['run'], shard_count
+        elif header['run'] != run or shard_count != count:
+            raise ValueError('{} is from a different run'.format(path))
+        if index in shards:
+            raise ValueError('Shard {}/{} is given twice: {} and {}'.format(
+                index, count, shards[index], path))
+        if trailer is None:
+            raise ValueError('{} is incomplete (shard {}/{} did not finish)'.format(
+                path, index, count))
+        shards[index] = path
+    if run is None:
+        raise ValueError('No partial result files given')
+    missing = sorted(set(range(count)) - set(shards))
+    if missing:
+        raise ValueError('Missing shard(s) {} of {}'.format(
+            ', '.join(str(index) for index in missing), count))
+
+    check_names = run['checks']
+    index = None
+    if any(check_name in aggregate_check_list for check_name in check_names):
+        index = MetadataIndex()
+    exit_status = 0
+    for shard_index in range(count):
+        for file_result in read_partial_records(shards[shard_index]):
+            if index is not None:
+                index.add(file_result.path, file_result.extracts.get('file_summary'))
+            if file_result.failed:
+                exit_status = 1
+            report.write(file_result.path, file_result.results)
+    if index is not None:
+        exit_status = _report_across_files(index, check_names, report) or exit_status
+    return exit_status
+
+
+def _report_across_files(index, check_names, report):
+    # Reports the results of the checks across files; returns 1 if any
+    # failed, otherwise 0
+    by_path = collections.OrderedDict()
+    for path, result in index.run(check_names):
+        by_path.setdefault(path, []).append(result)
+    for path, results in by_path.items():
+        report.write(path, results)
+    return 1 if by_path else 0
+
+
+def warm_up():
+    '''Imports the scientific stack now, rather than when the first data
+    file is checked, so worker processes forked later start with it'''
+    for module in ('numpy', 'netCDF4', 'nchelpers'):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+
+class LintServer(object):
+    '''Answers lint requests, one JSON object per line, for `--serve`.
+
+    A request is an object with the `paths` (files or directories) to
+    check, and optionally an `id` (echoed in the response), the `checks`
+    to run (default: `check_names`) and a `timeout` in seconds (default:
+    `timeout`). The response gives the request's `id`, its `status`
+    ('ok', 'error' for a bad request, or 'timeout', with an `error`
+    message for either of those), whether any check
+    `failed`, and for each file checked its `file`, whether it `failed`,
+    and its `results` (see `result_record`).
+
+    Files are checked by a Supervisor's `jobs` worker processes, each file
+    limited to `file_timeout` seconds and `max_rss` bytes, and the files in
+    progress when a request times out are abandoned, so a stuck file can't
+    hold up later requests. Requests are handled one at a time.
+    '''
+
+    def __init__(self, check_names, jobs, timeout=None, cache=None,
+                 include=('*.nc',), exclude=(), file_timeout=None, max_rss=None):
+        self.check_names = check_names
+        self.jobs = jobs
+        self.timeout = timeout
+        self.cache = cache
+        self.include = include
+        self.exclude = exclude
+        self.lock = threading.Lock()
+        warm_up()
+        self.supervisor = Supervisor(jobs, file_timeout, max_rss, detach=True)
+
+    def handle(self, line):
+        '''Returns the response (a line of JSON) to request `line`'''
+        with self.lock:
+            request_id = None
+            try:
+                request = json.loads(line)
+                if isinstance(request, dict):
+                    request_id = request.get('id')
+                response = self.answer(request)
+            except ValueError as e:
+                response = self.error(request_id, str(e))
+            except Exception as e:
+                # However bad a request, it mustn't take the server down
+                response = self.error(request_id, '{}: {}'.format(type(e).__name__, e))
+        return json.dumps(response, default=_json_default) + '\n'
+
+    @staticmethod
+    def error(request_id, message):
+        '''Returns the response to a request that couldn't be answered'''
+        return collections.OrderedDict([('id', request_id), ('status', 'error'), ('error', message),
+                                        ('failed', True), ('files', [])])
+
+    def answer(self, request):
+        import multiprocessing
+
+        if not isinstance(request, dict):
+            raise ValueError('A request must be a JSON object')
+        paths = request.get('paths', [])
+        if isinstance(paths, str):
+            paths = [paths]
+        if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+            raise ValueError('paths must be a path or a list of paths')
+        checks = request.get('checks') or self.check_names
+        if isinstance(checks, str):
+            checks = checks.split(',')
+        if not isinstance(checks, (list, tuple)) or not all(isinstance(check, str) for check in checks):
+            raise ValueError('checks must be a list of check names')
+        timeout = request.get('timeout', self.timeout)
+        if timeout is not None and (isinstance(timeout, bool) or
+                                    not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise ValueError('timeout must be a positive number of seconds')
+        response = collections.OrderedDict([('id', request.get('id')), ('status', 'ok')])
+        files = []
+        try:
+            for file_result in lint(paths, checks, self.jobs,
+                                    include=self.include, exclude=self.exclude, cache=self.cache,
+                                    supervisor=self.supervisor, timeout=timeout):
+                files.append(collections.OrderedDict([
+                    ('file', file_result.path),
+                    ('failed', file_result.failed),
+                    ('results', [result_record(result) for result in file_result.results]),
+                ]))
+        except ValueError as e:
+            response.update(status='error', error=str(e))
+        except multiprocessing.TimeoutError:
+            response.update(status='timeout',
+                            error='Timed out after {} s; later files were not checked'.format(timeout))
+        if self.cache:
+            self.cache.commit()
+        # As on the command line, anything that stops a check running is a failure
+        response['failed'] = response['status'] != 'ok' or any(file_['failed'] for file_ in files)
+        response['files'] = files
+        return response
+
+    def close(self):
+        self.supervisor.close()
+
+
+def serve(address, server):
+    """Answers the requests for LintServer `server` on Unix domain socket
+    `address`, or on standard input and output if `address` is '-'"""
+    if address == '-':
+        for line in sys.stdin:
+            if line.strip():
+                sys.stdout.write(server.handle(line))
+                sys.stdout.flush()
+        return
+
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write(server.handle(line.decode('utf-8')).encode('utf-8'))
+                    self.wfile.flush()
+
+    import stat
+    # Replace the socket a previous server left behind, but nothing else
+    if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+        os.remove(address)
+    socket_server = socketserver.ThreadingUnixStreamServer(address, Handler)
+    # Also stop cleanly, removing the socket, when a service manager stops us
+    import signal
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    socket_server.daemon_threads = True
+    try:
+        socket_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        socket_server.server_close()
+        os.remove(address)
+
+
+def export_snapshot(path, paths, args):
+    '''Writes the headers of the files in `paths` to the Snapshot at `path`,
+    for --export-snapshot; returns the exit status'''
+    snapshot = Snapshot(path)
+    exit_status = 0
+    try:
+        for file_result in lint(paths, [], args.jobs, include=args.include or ['*.nc'],
+                                exclude=args.exclude, file_timeout=args.timeout,
+                                max_rss=args.max_rss, snapshot=snapshot):
+            if 'header_record' not in file_result.extracts:
+                print('{}: cannot read header'.format(file_result.path), file=sys.stderr)
+                exit_status = 1
+    finally:
+        snapshot.close()
+    return exit_status
+
+
+def merge_main(argv):
+    '''Runs `nclint.py merge` with arguments `argv`; returns the exit status'''
+    parser = argparse.ArgumentParser(
+        prog='nclint.py merge',
+        description='Combine the partial result files of the shards of a run (see --shard '
+                    'and --partial) into one report and exit status')
+    parser.add_argument('partials', metavar='PARTIAL_FILE', nargs='+',
+            help='Partial result file, one from each shard')
+    parser.add_argument('-v', '--verbose', action='store_true',
+            help='Provide more detail about check failures')
+    parser.add_argument('-f', '--format', choices=sorted(report_formats), default='text',
+            help='Output format (default: text)')
+    args = parser.parse_args(argv)
+
+    try:
+        headers = [read_partial_header(path)[0] for path in args.partials]
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    report = report_formats[args.format](sys.stdout, headers[0]['run']['checks'], args.verbose)
+    try:
+        exit_status = merge(args.partials, report)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    report.close()
+    return exit_status
+
+
+def main(argv=None):
+    '''Runs the nclint command line with arguments `argv` (default: sys.argv);
+    returns the exit status. `nclint.py merge ...` runs `merge_main`.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['merge']:
+        return merge_main(argv[1:])
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', metavar='FILE', type=str, nargs='*',
+            help='File to check, or directory to search (recursively) for files to check')
+    parser.add_argument('-c', '--checks', default='layer_one_missing',
+            help='Comma separated list of check names to be performed')
+    parser.add_argument('-l', '--list_checks', action='store_true',
+            help='List the names of all available checks and exit',
+            default=False)
+    parser.add_argument('-v', '--verbose', action='store_true',
+            help='Provide more detail about available checks and check failures',
+            default=False)
+    parser.add_argument('-f', '--format', choices=sorted(report_formats), default='text',
+            help='Output format: text lists failed files (or, with -v, failed checks); '
+                 'jsonl and csv give one record per file and check, with its result, '
+                 'status and timing')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+            help='Number of worker processes used to check files in parallel '
+                 '(0 means one per CPU)')
+    parser.add_argument('--files-from', metavar='LIST_FILE',
+            help="Also check the files (or directories) listed in LIST_FILE, one per "
+                 "line; '-' reads the list from standard input")
+    parser.add_argument('-0', '--null', action='store_true', default=False,
+            help='Paths in the --files-from list are separated by NUL characters, '
+                 'not newlines')
+    parser.add_argument('--include', metavar='PATTERN', action='append',
+            help="Check files found in directories only if their names match PATTERN "
+                 "(may be repeated; default: '*.nc')")
+    parser.add_argument('--exclude', metavar='PATTERN', action='append', default=[],
+            help='Skip files and directories found in directories whose names match '
+                 'PATTERN (may be repeated)')
+    parser.add_argument('--profile', action='store_true', default=False,
+            help='Show progress, and at the end per-check timing percentiles, on stderr')
+    parser.add_argument('--profile-dir', metavar='DIR',
+            help='Save cProfile statistics for the slowest files in DIR (implies --profile)')
+    parser.add_argument('--profile-slowest', metavar='N', type=int, default=10,
+            help='Number of slowest files to keep cProfile statistics for (default: 10)')
+    parser.add_argument('--report-reads', action='store_true', default=False,
+            help='Report the number of bytes of variable data read from each file '
+                 '(on stderr)')
+    parser.add_argument('--cache', metavar='CACHE_FILE',
+            default=os.environ.get('NCLINT_CACHE'),
+            help='SQLite file in which to cache check results, so that unchanged '
+                 'files are not checked again (default: $NCLINT_CACHE)')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+            help='Neither read nor write the result cache')
+    parser.add_argument('--prune-cache', action='store_true', default=False,
+            help='Remove cache entries for changed or deleted files and for '
+                 'changed checks before checking files')
+    parser.add_argument('--prefetch', metavar='N', type=int, default=0,
+            help='Prefetch files (their metadata and the data the checks will read) '
+                 'N files ahead of checking them, so that waiting for I/O overlaps with '
+                 'checking (default: 0, no prefetching)')
+    parser.add_argument('--timeout', metavar='SECONDS', type=float,
+            help='Give up on a file that takes longer than SECONDS to check, reporting '
+                 'it as an error (files are then checked in worker processes)')
+    parser.add_argument('--max-rss', metavar='BYTES', type=parse_size,
+            help='Give up on a file whose checking takes more than BYTES of memory '
+                 '(resident), e.g. 4G, reporting it as an error (Linux; files are then '
+                 'checked in worker processes)')
+    parser.add_argument('--block-size', metavar='BYTES', type=parse_size, default=block_bytes,
+            help='Largest block of data that checks scanning whole variables (e.g. '
+                 'masked_layers) read at once, e.g. 64M (default: {}M)'.format(block_bytes // 2 ** 20))
+    parser.add_argument('--io-budget', metavar='BUDGET', type=parse_budget,
+            help='Most variable data to read from each file, in bytes (e.g. 512M) or seconds '
+                 '(e.g. 2s); data checks that would read more read a random sample of their '
+                 'blocks instead, and report the fraction read')
+    parser.add_argument('--sample-seed', metavar='SEED', type=int, default=sample_seed,
+            help='Seed for the samples taken under --io-budget (default: {})'.format(sample_seed))
+    parser.add_argument('--serve', metavar='SOCKET',
+            help="Stay running and answer lint requests (lines of JSON) on Unix domain "
+                 "socket SOCKET, or on standard input and output if SOCKET is '-', "
+                 "instead of checking FILEs (see LintServer)")
+    parser.add_argument('--request-timeout', metavar='SECONDS', type=float,
+            help='With --serve, the default time limit for answering a request')
+    parser.add_argument('--shard', metavar='I/N', type=parse_shard,
+            help='Check only shard I (from 0) of N of the files, e.g. to split a run '
+                 'across nodes; every shard must be given the same FILEs (see '
+                 '--shard-by and --partial)')
+    parser.add_argument('--shard-by', choices=shard_methods, default='size',
+            help='How files are assigned to shards: size (balances the data in each '
+                 'shard, but stats every file first; default) or hash (of the path)')
+    parser.add_argument('--partial', metavar='PARTIAL_FILE',
+            help="Also write the results to PARTIAL_FILE, to be combined with the other "
+                 "shards' by 'nclint.py merge PARTIAL_FILE...'")
+    parser.add_argument('--export-snapshot', metavar='SNAPSHOT_FILE',
+            help='Instead of checking FILEs, write a snapshot of their headers to '
+                 'SNAPSHOT_FILE (SQLite), for checking with --snapshot')
+    parser.add_argument('--snapshot', metavar='SNAPSHOT_FILE',
+            help='Run the (header-only) checks on the headers in SNAPSHOT_FILE instead of '
+                 'on the files themselves; FILEs, if given, select the files (or '
+                 'directories) to check')
+
+    args = parser.parse_args(argv)
+    configure(block_bytes=args.block_size, sample_seed=args.sample_seed)
+    if args.io_budget:
+        configure(io_budget_bytes=args.io_budget[0], io_budget_seconds=args.io_budget[1])
+
+    if args.jobs < 0:
+        parser.error('--jobs must not be negative')
+    if args.prefetch < 0:
+        parser.error('--prefetch must not be negative')
+    if args.timeout is not None and args.timeout <= 0:
+        parser.error('--timeout must be positive')
+
+    if args.list_checks:
+        if args.verbose:
+            for check_name in check_list:
+                check = globals()[check_name]
+                print('{}:\n{}\n'.format(check_name, check.__doc__))
+        else:
+            print("Available checks:", ','.join(check_list))
+        return 0
+
+    check_names = args.checks.split(',')
+    for check in check_names:
+        if check not in check_list:
+            print("NetCDF check '{}' does not exist".format(check), file=sys.stderr)
+            return 1
+
+    cache = None
+    if args.cache and not args.no_cache:
+        cache = ResultCache(args.cache)
+        if args.prune_cache:
+            print('Pruned {} cache entries'.format(cache.prune()), file=sys.stderr)
+    elif args.prune_cache:
+        parser.error('--prune-cache requires a cache file (--cache)')
+
+    if args.serve:
+        server = LintServer(check_names, args.jobs or os.cpu_count() or 1, args.request_timeout,
+                            cache, args.include or ['*.nc'], args.exclude, args.timeout,
+                            args.max_rss)
+        try:
+            serve(args.serve, server)
+        finally:
+            server.close()
+            if cache:
+                cache.close()
+        return 0
+
+    # In non-verbose text mode, we only care whether a file is good/bad. If
+    # it fails, skip the rest of the checks
+    stop_on_failure = args.format == 'text' and not args.verbose
+
+    if args.snapshot:
+        not_header = [check for check in check_names if check not in header_check_list]
+        if not_header:
+            print('--snapshot only supports checks that only read the header, not: {}'.format(
+                ','.join(not_header)), file=sys.stderr)
+            return 1
+
+    paths = args.files
+    if args.files_from:
+        separator = b'\0' if args.null else b'\n'
+        if args.files_from == '-':
+            listed = read_paths(sys.stdin.buffer, separator)
+        else:
+            listed = read_path_file(args.files_from, separator)
+        paths = itertools.chain(paths, listed)
+
+    if args.export_snapshot:
+        return export_snapshot(args.export_snapshot, paths, args)
+
+    shard = None
+    if args.shard:
+        shard = args.shard + (args.shard_by,)
+    snapshot = None
+    if args.snapshot:
+        # lint() doesn't shard datasets it is given open, so shard the
+        # snapshot's entries before they are opened
+        snapshot = Snapshot(args.snapshot)
+        paths = snapshot.datasets(paths, shard)
+        shard = None
+
+    report = report_formats[args.format](sys.stdout, check_names, args.verbose)
+    profile = None
+    if args.profile or args.profile_dir:
+        profile = RunProfile(sys.stderr, args.profile_slowest)
+    index = None
+    if any(check_name in aggregate_check_list for check_name in check_names):
+        index = MetadataIndex()
+    partial = None
+    if args.partial:
+        run = collections.OrderedDict((
+            ('checks', check_names),
+            ('inputs', args.files + (['--files-from', args.files_from] if args.files_from else [])),
+            ('include', args.include or ['*.nc']),
+            ('exclude', args.exclude),
+            ('stop_on_failure', stop_on_failure),
+            ('shard_by', args.shard_by),
+            ('snapshot', args.snapshot),
+        ))
+        partial = PartialResults(open(args.partial, 'w'), run, args.shard or (0, 1))
+    exit_status = 0
+    try:
+        for file_result in lint(paths, check_names, args.jobs, stop_on_failure,
+                                args.include or ['*.nc'], args.exclude, cache, args.profile_dir,
+                                prefetch=args.prefetch, file_timeout=args.timeout,
+                                max_rss=args.max_rss, index=index, shard=shard):
+            if args.report_reads:
+                print('{} read {} bytes'.format(file_result.path, file_result.bytes_read),
+                      file=sys.stderr)
+            if profile:
+                profile.add(file_result)
+            if file_result.failed:
+                exit_status = 1
+            report.write(file_result.path, file_result.results)
+            if partial:
+                partial.write(file_result)
+        if index is not None and not partial:
+            # Checks across files are reported once all the files are in.
+            # A shard's files are only some of them, so for a shard these
+            # are left to `merge`.
+            exit_status = _report_across_files(index, check_names, report) or exit_status
+        if partial:
+            partial.close(exit_status)
+    finally:
+        if cache:
+            cache.close()
+        if snapshot:
+            snapshot.close()
+    report.close()
+    if profile:
+        profile.summary()
+    return exit_status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,7 +11,9 @@ setup(
     author="James Hiebert",
     author_email="hiebert@uvic.ca",
     zip_safe=True,
-    install_requires=['nchelpers', 'numpy'],
+    install_requires=['nchelpers', 'netCDF4', 'numpy'],
+    python_requires='>=3.6',
+    py_modules=['nclint'],
     scripts=['nclint.py'],
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -20,9 +22,9 @@ setup(
         'Intended Audience :: Science/Research',
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)'
         'Operating System :: OS Independent',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Scientific/Engineering',
         'Topic :: Database',
         'Topic :: Software Development :: Libraries :: Python Modules'
@@ -0,0 +1,212 @@
+"""Benchmarks nclint's checks and command line over a synthetic corpus.
+
+Builds a corpus of test files covering a matrix of grid sizes, time steps,
+chunking, compression, 3-D/4-D data, masked layers and coordinates and file
+formats (see make-perfect-test-file.py), then times every registered check
+on every file, and the command line end to end (including startup with
+`-l`, which must not import numpy).
+
+Results are written as JSON (--output) so they can be tracked over time, and
+can be compared against an earlier result file (--compare); any benchmark
+that has slowed by more than --threshold is reported and the exit status is
+1.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+nclint_script = os.path.join(here, os.pardir, 'nclint.py')
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# name -> make_test_file keyword arguments
+corpus_matrix = {
+    'attrs_only': dict(filetype='downscaled'),
+    'small_nc4': dict(filetype='downscaled', grid=(50, 60), times=13),
+    'small_classic': dict(filetype='downscaled', format='NETCDF3_CLASSIC', grid=(50, 60), times=13),
+    'small_cdf5': dict(filetype='hydromodel_gcm', format='NETCDF3_64BIT_DATA', grid=(50, 60), times=13),
+    'large_chunked_zlib': dict(filetype='downscaled', grid=(400, 500), times=13,
+                               chunks=(1, 100, 100), complevel=4),
+    'large_contiguous': dict(filetype='downscaled', grid=(400, 500), times=13),
+    'long_time_axis': dict(filetype='hydromodel_obs', grid=(10, 10), times=20000,
+                           chunks=(1000, 10, 10)),
+    'time_major_chunks': dict(filetype='downscaled', grid=(200, 200), times=200,
+                              chunks=(200, 10, 10), complevel=1),
+    'four_d': dict(filetype='downscaled', grid=(100, 100), times=13, levels=10,
+                   chunks=(1, 1, 100, 100)),
+    'masked_layer_one': dict(filetype='downscaled', grid=(200, 200), times=13,
+                             mask_layer_one=True),
+    'masked_coords': dict(filetype='downscaled', grid=(50, 60), times=13, mask_coords=True),
+}
+
+
+def make_corpus(directory, make_test_file):
+    paths = {}
+    for name, options in sorted(corpus_matrix.items()):
+        path = os.path.join(directory, name + '.nc')
+        if not os.path.exists(path):
+            options = dict(options)
+            make_test_file(path, options.pop('filetype'), **options)
+        paths[name] = path
+    return paths
+
+
+def drop_caches():
+    """Empties the OS page cache (Linux, as root), so files are read cold"""
+    subprocess.check_call(['sync'])
+    with open('/proc/sys/vm/drop_caches', 'w') as control:
+        control.write('3\n')
+
+
+def best_of(function, repeat, cold=False):
+    times = []
+    for _ in range(repeat):
+        if cold:
+            drop_caches()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_checks(nclint, paths, repeat):
+    results = {}
+    for check_name in nclint.check_list:
+        if check_name in nclint.aggregate_check_list:
+            continue  # These run on a run's index of files, not on a file
+        for name, path in sorted(paths.items()):
+            outcome = {}
+
+            def run():
+                outcome['result'] = nclint.lint_file(path, [check_name])
+
+            key = 'check.{}.{}'.format(check_name, name)
+            results[key] = {'seconds': best_of(run, repeat)}
+            errors = [r.error for r in outcome['result'].results if r.error]
+            if errors:
+                results[key]['error'] = errors[0]
+    return results
+
+
+def bench_cli(paths, repeat, cold=False):
+    python = sys.executable
+    files = [paths[name] for name in sorted(paths)]
+    commands = {
+        'cli.list_checks': [python, nclint_script, '-l'],
+        'cli.header_checks': [python, nclint_script, '-c',
+                              'missing_downscaling_mandatory_global_attrs,vars_missing_units'] + files,
+        'cli.layer_one_missing': [python, nclint_script, '-c', 'layer_one_missing'] + files,
+        'cli.layer_one_missing_prefetch': [python, nclint_script, '-c', 'layer_one_missing',
+                                           '--prefetch', '4'] + files,
+        'cli.all_checks_jsonl': [python, nclint_script, '-f', 'jsonl', '-c',
+                                 'layer_one_missing,has_masked_dimensions,missing_time_units'] + files,
+    }
+    results = {}
+    for key, command in sorted(commands.items()):
+        def run():
+            subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        results[key] = {'seconds': best_of(run, repeat, cold)}
+    return results
+
+
+def check_startup_imports():
+    """Returns the heavy modules imported by `nclint.py -l` (should be none)"""
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', nclint_script, '-l'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+    ).stderr
+    imported = {line.rsplit('|', 1)[-1].strip() for line in output.splitlines()}
+    return sorted(imported & {'numpy', 'netCDF4', 'nchelpers'})
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key in baseline and baseline[key]['seconds'] > 0:
+            ratio = result['seconds'] / baseline[key]['seconds']
+            if ratio > threshold:
+                regressions.append((key, baseline[key]['seconds'], result['seconds'], ratio))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=here, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--corpus', help='Directory in which to build (or reuse) the corpus '
+                                         '(default: a temporary directory)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of times to run each benchmark; the best time is kept')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='Compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Slow-down ratio reported as a regression (default: 1.25)')
+    parser.add_argument('--skip-cli', action='store_true', help="Don't benchmark the command line")
+    parser.add_argument('--drop-caches', action='store_true',
+                        help='Drop the page cache before each command line run, to time '
+                             'cold reads (Linux, needs root)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(nclint_script))
+    import nclint
+    make_test_file = load_module(
+        'make_perfect_test_file', os.path.join(here, 'make-perfect-test-file.py')).make_test_file
+
+    corpus = args.corpus or tempfile.mkdtemp(prefix='nclint-bench-')
+    if not os.path.isdir(corpus):
+        os.makedirs(corpus)
+    paths = make_corpus(corpus, make_test_file)
+
+    results = bench_checks(nclint, paths, args.repeat)
+    if not args.skip_cli:
+        results.update(bench_cli(paths, args.repeat, args.drop_caches))
+
+    for key, result in sorted(results.items()):
+        print('{:<80} {:>10.4f}s {}'.format(key, result['seconds'], result.get('error', '')))
+
+    status = 0
+    heavy = check_startup_imports()
+    if heavy:
+        print('REGRESSION: nclint.py -l imports {}'.format(', '.join(heavy)))
+        status = 1
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        for key, before, after, ratio in compare(results, baseline, args.threshold):
+            print('REGRESSION: {} {:.4f}s -> {:.4f}s ({:.2f}x)'.format(key, before, after, ratio))
+            status = 1
+
+    sys.exit(status)
@@ -1,5 +1,6 @@
 import argparse
 
+import numpy
 import netCDF4
 
 
@@ -118,14 +119,103 @@ def assign_attrs(nc, attrs, value='value'):
         setattr(nc, attr, value)
 
 
+def add_data(nc, grid, times, levels=0, chunks=None, complevel=0,
+             mask_layer_one=False, mask_coords=False, fill_value=-9999.0):
+    """Adds coordinate variables and a data variable 'tas' to open file `nc`.
+
+    `grid` is a (ny, nx) pair, and there are `times` time steps. If `levels`
+    is positive, 'tas' is 4-D (time, lev, lat, lon), otherwise 3-D.
+    `chunks` and `complevel` set the chunk shape and zlib compression level
+    of 'tas' (netCDF-4 formats only). If `mask_layer_one`, the layer at t=1
+    is entirely masked; if `mask_coords`, the last time value is masked.
+    """
+    ny, nx = grid
+    netcdf4 = nc.data_model.startswith('NETCDF4')
+
+    nc.createDimension('time', None)
+    if levels > 0:
+        nc.createDimension('lev', levels)
+    nc.createDimension('lat', ny)
+    nc.createDimension('lon', nx)
+
+    time = nc.createVariable('time', 'f8', ('time',), fill_value=fill_value)
+    time.units = 'days since 1950-01-01 00:00:00'
+    time.calendar = 'standard'
+    lat = nc.createVariable('lat', 'f4', ('lat',))
+    lat.units = 'degrees_north'
+    lat[:] = numpy.linspace(40, 60, ny)
+    lon = nc.createVariable('lon', 'f4', ('lon',))
+    lon.units = 'degrees_east'
+    lon[:] = numpy.linspace(-140, -110, nx)
+    dims = ('time', 'lat', 'lon')
+    if levels > 0:
+        lev = nc.createVariable('lev', 'f4', ('lev',))
+        lev.units = 'm'
+        lev[:] = numpy.arange(levels)
+        dims = ('time', 'lev', 'lat', 'lon')
+
+    options = {}
+    if netcdf4:
+        if chunks:
+            options['chunksizes'] = chunks
+        if complevel:
+            options.update(zlib=True, complevel=complevel)
+    tas = nc.createVariable('tas', 'f4', dims, fill_value=fill_value, **options)
+    tas.units = 'K'
+
+    layer_shape = tas.shape[1:]
+    random = numpy.random.RandomState(0)
+    for t in range(times):
+        if t == 1 and mask_layer_one:
+            tas[t] = numpy.ma.masked_all(layer_shape, dtype='f4')
+        else:
+            tas[t] = (250 + 50 * random.random_sample(layer_shape)).astype('f4')
+    time[:] = numpy.arange(times, dtype='f8')
+    if mask_coords and times:
+        time[times - 1] = numpy.ma.masked
+
+
+def make_test_file(path, filetype, format='NETCDF4', grid=None, **data_options):
+    """Writes a test file of type `filetype` (see `attrs_by_filetype`) to `path`.
+
+    If `grid` is given, coordinate and data variables are added (see
+    `add_data` for `data_options`); otherwise the file holds only global
+    attributes.
+    """
+    with netCDF4.Dataset(path, mode='w', format=format) as nc:
+        assign_attrs(nc, attrs_by_filetype[filetype])
+        if grid:
+            add_data(nc, grid, **data_options)
+
+
+def _int_list(text):
+    return [int(item) for item in text.replace('x', ',').split(',')]
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('file', type=str, help='Output file name')
     parser.add_argument('-t', '--type', required=True, help='Output file type',
                         choices=attrs_by_filetype.keys())
+    parser.add_argument('--format', default='NETCDF4', help='Output file format',
+                        choices=['NETCDF4', 'NETCDF4_CLASSIC', 'NETCDF3_CLASSIC',
+                                 'NETCDF3_64BIT_OFFSET', 'NETCDF3_64BIT_DATA'])
+    parser.add_argument('--grid', type=_int_list,
+                        help='Add data on a grid of this size, e.g. 100x200 (NYxNX)')
+    parser.add_argument('--times', type=int, default=13, help='Number of time steps')
+    parser.add_argument('--levels', type=int, default=0,
+                        help='Number of levels; if positive the data variable is 4-D')
+    parser.add_argument('--chunks', type=_int_list,
+                        help='Chunk shape of the data variable, e.g. 1,100,200')
+    parser.add_argument('--complevel', type=int, default=0, help='zlib compression level')
+    parser.add_argument('--mask-layer-one', action='store_true',
+                        help='Mask the whole layer at t=1')
+    parser.add_argument('--mask-coords', action='store_true',
+                        help='Mask the last time coordinate value')
     args = parser.parse_args()
 
-    with netCDF4.Dataset(args.file, mode='w') as nc:
-        attrs =  attrs_by_filetype[args.type]
-        assign_attrs(nc, attrs)
-
+    make_test_file(
+        args.file, args.type, format=args.format, grid=args.grid, times=args.times,
+        levels=args.levels, chunks=args.chunks, complevel=args.complevel,
+        mask_layer_one=args.mask_layer_one, mask_coords=args.mask_coords,
+    )
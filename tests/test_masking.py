@@ -0,0 +1,75 @@
+"""Checks that nclint masks raw values as netCDF4 does, including when
+masking attributes can't be cast to the variable's type."""
+
+import os
+import sys
+
+import pytest
+
+netCDF4 = pytest.importorskip('netCDF4')
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import nclint
+
+
+# name -> (dtype, masking attributes, values)
+variables = {
+    'fill_out_of_range': ('i2', {'missing_value': numpy.float64(1e20)}, numpy.arange(24)),
+    'fill_in_range': ('i2', {'missing_value': numpy.int16(3)}, numpy.arange(24)),
+    'valid_range_first': ('f4', {'valid_range': numpy.array([0, 10], 'f4'),
+                                 'valid_min': numpy.float32(5)}, numpy.arange(24)),
+    'valid_min_max': ('f8', {'valid_min': 2.0, 'valid_max': 20.0}, numpy.arange(24)),
+    'valid_max_out_of_range': ('i1', {'valid_max': numpy.float64(1000)}, numpy.arange(24)),
+}
+
+
+@pytest.fixture(scope='module')
+def path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('masking') / 'masking.nc')
+    with netCDF4.Dataset(path, 'w', format='NETCDF3_CLASSIC') as nc:
+        nc.createDimension('time', 3)
+        nc.createDimension('x', 4)
+        nc.createDimension('y', 2)
+        x = nc.createVariable('x', 'i2', ('x',))
+        x.setncattr('missing_value', numpy.float64(1e20))
+        x[:] = [1, 2, 3, 4]
+        for name, (dtype, attrs, values) in variables.items():
+            var_ = nc.createVariable(name, dtype, ('time', 'x', 'y'))
+            var_.set_auto_maskandscale(False)
+            for attr, value in attrs.items():
+                var_.setncattr(attr, value)
+            var_[:] = values.reshape(3, 4, 2).astype(dtype)
+    return path
+
+
+def nclint_mask(var_):
+    rules = nclint.masking_rules(var_)
+    with nclint.raw_values(var_):
+        raw = numpy.asarray(var_[:])
+    return nclint.masked_values(raw, rules)
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning', 'ignore::RuntimeWarning')
+@pytest.mark.parametrize('name', sorted(variables) + ['x'])
+def test_masks_as_netcdf4(path, name):
+    with netCDF4.Dataset(path) as nc:
+        expected = numpy.ma.getmaskarray(nc.variables[name][:])
+        assert (nclint_mask(nc.variables[name]) == expected).all()
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning', 'ignore::RuntimeWarning')
+@pytest.mark.parametrize('name', sorted(variables) + ['x'])
+def test_header_masks_as_netcdf4(path, name):
+    with netCDF4.Dataset(path) as nc:
+        expected = numpy.ma.getmaskarray(nc.variables[name][:])
+    header = nclint.read_header(path)
+    var_ = header.variables[name]
+    assert (nclint.masked_values(numpy.asarray(var_.mapped()), nclint.masking_rules(var_)) == expected).all()
+    header.close()
+
+
+def test_checks_with_fill_value_out_of_range(path):
+    results = nclint.lint_file(path, ['layer_one_missing', 'masked_layers', 'has_masked_dimensions'])
+    assert [result.error for result in results.results] == [None, None, None]
+    assert [result.value for result in results.results] == [False, {'valid_range_first': [2]}, []]
@@ -0,0 +1,47 @@
+"""Checks that data read once for several checks is counted for each of
+them, and towards the read rate."""
+
+import io
+import os
+import sys
+
+import pytest
+
+netCDF4 = pytest.importorskip('netCDF4')
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import nclint
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'shared.nc')
+    with netCDF4.Dataset(path, 'w', format='NETCDF3_64BIT_OFFSET') as nc:
+        nc.createDimension('time', 13)
+        nc.createDimension('lat', 50)
+        nc.createDimension('lon', 60)
+        var_ = nc.createVariable('tas', 'f4', ('time', 'lat', 'lon'), fill_value=1e20)
+        var_[:] = numpy.ones((13, 50, 60), dtype='f4')
+    return path
+
+
+def test_checks_sharing_a_block_count_its_bytes(path, monkeypatch):
+    monkeypatch.setattr(nclint, '_read_rate', [None])
+    file_result = nclint.lint_file(path, ['layer_one_missing', 'masked_layers'])
+    layer_one, masked = file_result.results
+    assert [layer_one.error, masked.error] == [None, None]
+    # The layer at t=1 is part of the block masked_layers reads, so is read
+    # from the file once but counted for both checks
+    assert layer_one.bytes_read == 50 * 60 * 4
+    assert masked.bytes_read == 13 * 50 * 60 * 4
+    assert file_result.bytes_read == 13 * 50 * 60 * 4
+    assert nclint._read_rate[0] is not None
+
+
+def test_profile_counts_shared_bytes(path):
+    file_result = nclint.lint_file(path, ['layer_one_missing', 'masked_layers'])
+    profile = nclint.RunProfile(io.StringIO())
+    profile.add(file_result)
+    assert profile.stages['layer_one_missing']['bytes_read'] > 0
+    assert profile.stages['masked_layers']['bytes_read'] > 0
@@ -0,0 +1,57 @@
+"""Checks that nclint starts without importing the scientific stack when it
+doesn't need it (listing checks, header-only checks)."""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+nclint_script = os.path.join(here, os.pardir, 'nclint.py')
+
+heavy_modules = ('numpy', 'netCDF4', 'nchelpers')
+
+# Runs nclint.py as a script with the given arguments, then prints which of
+# the heavy modules it imported as the last line of its output
+run_script = '''
+import sys, json, runpy
+sys.argv = [{script!r}] + {args!r}
+try:
+    runpy.run_path({script!r}, run_name='__main__')
+except SystemExit:
+    pass
+sys.stdout.flush()
+print(json.dumps(sorted(set({heavy!r}) & set(sys.modules))))
+'''
+
+
+def heavy_imports(*args):
+    '''Returns the heavy modules in sys.modules after running nclint.py with
+    `args` in a fresh interpreter'''
+    code = run_script.format(script=nclint_script, args=list(args), heavy=heavy_modules)
+    output = subprocess.run(
+        [sys.executable, '-c', code],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_list_checks():
+    assert heavy_imports('-l') == []
+
+
+def test_list_checks_verbose():
+    assert heavy_imports('-l', '-v') == []
+
+
+def test_header_checks_on_classic_file(tmp_path):
+    netCDF4 = pytest.importorskip('netCDF4')
+    path = str(tmp_path / 'classic.nc')
+    with netCDF4.Dataset(path, 'w', format='NETCDF3_CLASSIC') as nc:
+        nc.Conventions = 'CF-1.6'
+        nc.createDimension('time', 2)
+        nc.createVariable('time', 'f8', ('time',)).units = 'days since 1950-01-01'
+    assert heavy_imports('-c', 'missing_cf_global_attrs,vars_missing_units', path) == []